@@ -0,0 +1,49 @@
+"""Compare two benchmark result files.
+
+Usage::
+
+    python benchmarks/compare.py base.json new.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+
+def flatten(value: object, prefix: str = "") -> dict[str, float]:
+    """Flatten nested results into dotted metric names."""
+    if isinstance(value, dict):
+        metrics = {}
+        for key, item in value.items():
+            metrics.update(flatten(item, f"{prefix}{key}."))
+        return metrics
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix.rstrip("."): float(value)}
+    return {}
+
+
+def main() -> None:
+    """Print every metric present in both files with its change."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    base_report = json.loads(Path(args.base).read_text())
+    new_report = json.loads(Path(args.new).read_text())
+    base = flatten(base_report["results"])
+    new = flatten(new_report["results"])
+
+    base_commit = str(base_report["commit"])
+    new_commit = str(new_report["commit"])
+    print(f"{'metric':<60} {base_commit:>12} {new_commit:>12}  change")
+    for name in sorted(base.keys() & new.keys()):
+        before, after = base[name], new[name]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<60} {before:>12.2f} {after:>12.2f}  {change:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
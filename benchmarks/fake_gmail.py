@@ -0,0 +1,485 @@
+"""In-process GMail stand-in for offline benchmarks.
+
+``FakeGmailHttp`` implements the ``httplib2.Http.request`` interface
+used by googleapiclient, so ``GMailServices(http=FakeGmailHttp(...))``
+talks to it through the real discovery based client. Messages are
+generated deterministically from their index, nothing is held in
+memory per message except the label changes made by modify calls.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+from email.parser import BytesParser
+from email.utils import format_datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+
+API_PREFIX = "/gmail/v1/users/me/"
+BATCH_PATHS = {"/batch", "/batch/gmail/v1"}
+
+SYSTEM_LABELS = [
+    "INBOX",
+    "UNREAD",
+    "STARRED",
+    "IMPORTANT",
+    "SENT",
+    "TRASH",
+    "SPAM",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_UPDATES",
+]
+
+DOMAINS = [
+    "example.com",
+    "mail.example.org",
+    "news.example.net",
+    "shop.example.io",
+    "social.example.co",
+]
+
+WORDS = (
+    "invoice meeting report weekly update order shipped account "
+    "security alert newsletter offer discount invitation reminder "
+    "project review release notes payment receipt subscription "
+    "welcome verify password event schedule summary digest"
+).split()
+
+
+def _b64(text: str) -> str:
+    """Encode like GMail, url safe base64."""
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def _text_part(mime_type: str, text: str) -> dict:
+    """A leaf MIME part with inline data."""
+    data = _b64(text)
+    return {
+        "mimeType": mime_type,
+        "filename": "",
+        "headers": [{"name": "Content-Type", "value": mime_type}],
+        "body": {"size": len(text), "data": data},
+    }
+
+
+def _multipart(mime_type: str, parts: list[dict]) -> dict:
+    """A multipart container."""
+    return {
+        "mimeType": mime_type,
+        "filename": "",
+        "headers": [{"name": "Content-Type", "value": mime_type}],
+        "body": {"size": 0},
+        "parts": parts,
+    }
+
+
+class MessageFactory:
+    """Generate synthetic messages with realistic MIME structures."""
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        seed: int = 0,
+        senders: int = 500,
+        body_words: int = 80,
+    ) -> None:
+        """Initialize the factory."""
+        self.count = count
+        self.seed = seed
+        self.senders = senders
+        self.body_words = body_words
+        self.now = datetime.now(UTC).replace(
+            hour=0,
+            minute=0,
+            second=0,
+            microsecond=0,
+        )
+
+    @staticmethod
+    def message_id(index: int) -> str:
+        """Message id for an index."""
+        return f"{index:016x}"
+
+    @staticmethod
+    def index(message_id: str) -> int:
+        """Index for a message id."""
+        return int(message_id, 16)
+
+    def thread_index(self, index: int) -> int:
+        """Messages are grouped into threads of up to 4 messages."""
+        return index - index % 4 if index % 7 else index
+
+    def thread_id(self, index: int) -> str:
+        """Thread id for a message index."""
+        return f"t{self.thread_index(index):015x}"
+
+    def _rng(self, index: int) -> random.Random:
+        """Deterministic random generator for a message."""
+        return random.Random(self.seed * 1_000_003 + index)
+
+    def sender(self, index: int) -> tuple[str, str]:
+        """Display name and address of the sender."""
+        rng = self._rng(index)
+        # NOTE: Log uniform, a few senders send most of the mail.
+        sender = int(self.senders ** rng.random()) - 1
+        domain = DOMAINS[sender % len(DOMAINS)]
+        return f"Sender {sender}", f"sender{sender}@{domain}"
+
+    def date(self, index: int) -> datetime:
+        """Newer messages have lower indexes, like the list API."""
+        return self.now - timedelta(minutes=17 * index)
+
+    def text(self, rng: random.Random, words: int) -> str:
+        """Random text."""
+        return " ".join(rng.choice(WORDS) for _ in range(words))
+
+    def headers(self, index: int, rng: random.Random) -> list[dict]:
+        """Headers of a message."""
+        name, address = self.sender(index)
+        date = self.date(index)
+        return [
+            {"name": "Delivered-To", "value": "me@example.com"},
+            {
+                "name": "Received",
+                "value": f"from mx.example.com; {format_datetime(date)}",
+            },
+            {"name": "From", "value": f"{name} <{address}>"},
+            {"name": "To", "value": "Me <me@example.com>"},
+            {"name": "Subject", "value": self.text(rng, 6).capitalize()},
+            {"name": "Date", "value": format_datetime(date)},
+            {
+                "name": "Message-ID",
+                "value": f"<{self.message_id(index)}@example.com>",
+            },
+        ]
+
+    def payload(self, index: int, rng: random.Random) -> dict:
+        """MIME payload, one of the common structures."""
+        body = self.text(rng, self.body_words)
+        html = f"<html><body><p>{body}</p></body></html>"
+        kind = index % 10
+        if kind < 5:
+            payload = _multipart(
+                "multipart/alternative",
+                [_text_part("text/plain", body), _text_part("text/html", html)],
+            )
+        elif kind < 7:
+            attachment = {
+                "mimeType": "application/pdf",
+                "filename": f"invoice-{index}.pdf",
+                "headers": [],
+                "body": {"attachmentId": f"att{index}", "size": 48_213},
+            }
+            payload = _multipart(
+                "multipart/mixed",
+                [
+                    _multipart(
+                        "multipart/alternative",
+                        [
+                            _text_part("text/plain", body),
+                            _text_part("text/html", html),
+                        ],
+                    ),
+                    attachment,
+                ],
+            )
+        elif kind < 9:
+            payload = _text_part("text/plain", body)
+        else:
+            payload = _text_part("text/html", html)
+
+        payload["partId"] = ""
+        payload["headers"] = self.headers(index, rng)
+        return payload
+
+    def labels(self, index: int) -> list[str]:
+        """Labels of a message."""
+        labels = ["INBOX", "CATEGORY_UPDATES"]
+        if index % 3 == 0:
+            labels.append("UNREAD")
+        return labels
+
+    def message(self, index: int, message_format: str = "full") -> dict:
+        """A message resource."""
+        rng = self._rng(index)
+        resource = {
+            "id": self.message_id(index),
+            "threadId": self.thread_id(index),
+            "labelIds": self.labels(index),
+            "snippet": self.text(rng, 12),
+            "historyId": str(10_000_000 - index),
+            "internalDate": str(int(self.date(index).timestamp() * 1000)),
+            "sizeEstimate": 2_000 + self.body_words * 8,
+        }
+        if message_format == "full":
+            resource["payload"] = self.payload(index, rng)
+        return resource
+
+
+class FakeGmailHttp:
+    """A thread safe fake of the GMail REST API.
+
+    :param count: number of messages in the mailbox.
+    :param latency: seconds slept before every response.
+    :param error_rate: probability of answering with a 429.
+    :param page_size: default page size of the list endpoint.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        page_size: int = 100,
+        seed: int = 0,
+    ) -> None:
+        """Initialize the fake."""
+        self.factory = MessageFactory(count, seed=seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.calls: Counter[str] = Counter()
+        self.errors = 0
+        self.label_changes: dict[str, tuple[list, list]] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def request(  # noqa: PLR0913
+        self,
+        uri: str,
+        method: str = "GET",
+        body: str | bytes | None = None,
+        headers: dict | None = None,
+        redirections: int = 5,  # noqa: ARG002
+        connection_type: object = None,  # noqa: ARG002
+    ) -> tuple[httplib2.Response, bytes]:
+        """Answer a request like the GMail API would."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        if urlparse(uri).path in BATCH_PATHS:
+            return self._batch(body, headers or {})
+        return self._handle(method, uri, body)
+
+    def _handle(
+        self,
+        method: str,
+        uri: str,
+        body: str | bytes | None,
+    ) -> tuple[httplib2.Response, bytes]:
+        """Answer a single, non batch, request."""
+        parsed = urlparse(uri)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        path = parsed.path.removeprefix(API_PREFIX)
+        route = self._route_name(method, path)
+
+        with self._lock:
+            self.calls[route] += 1
+            throttled = self._rng.random() < self.error_rate
+            if throttled:
+                self.errors += 1
+        if throttled:
+            return self._response(
+                429,
+                {"error": {"code": 429, "message": "Rate Limit Exceeded"}},
+            )
+
+        if isinstance(body, bytes):
+            body = body.decode()
+        payload = json.loads(body) if body else {}
+        return self._dispatch(method, path, query, payload)
+
+    def _batch(self, body: str | bytes, headers: dict) -> tuple:
+        """Answer a multipart/mixed batch of requests."""
+        if isinstance(body, str):
+            body = body.encode()
+        with self._lock:
+            self.calls["POST batch"] += 1
+        content_type = headers["content-type"].encode()
+        batch = BytesParser().parsebytes(
+            b"content-type: " + content_type + b"\r\n\r\n" + body,
+        )
+
+        boundary = "batch_fake_gmail"
+        parts = []
+        for part in batch.get_payload():
+            request_line, _, rest = part.get_payload().partition("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            _, _, inner_body = rest.partition("\r\n\r\n")
+            response, content = self._handle(
+                method,
+                f"https://gmail.googleapis.com{path}",
+                inner_body or None,
+            )
+            reason = HTTPStatus(response.status).phrase
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {response.status} {reason}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{content.decode()}\r\n",
+            )
+        parts.append(f"--{boundary}--\r\n")
+
+        response = httplib2.Response(
+            {
+                "status": 200,
+                "content-type": f"multipart/mixed; boundary={boundary}",
+            },
+        )
+        return response, "".join(parts).encode()
+
+    @staticmethod
+    def _route_name(method: str, path: str) -> str:
+        """Name a route for the call counters."""
+        parts = path.split("/")
+        if len(parts) >= 2:  # noqa: PLR2004
+            parts[1] = "{id}"
+        return f"{method} {'/'.join(parts)}"
+
+    @staticmethod
+    def _response(status: int, content: dict) -> tuple:
+        """Build an httplib2 response."""
+        response = httplib2.Response(
+            {"status": status, "content-type": "application/json"},
+        )
+        return response, json.dumps(content).encode()
+
+    def _dispatch(
+        self,
+        method: str,
+        path: str,
+        query: dict,
+        payload: dict,
+    ) -> tuple:
+        """Route a request to its handler."""
+        parts = path.split("/")
+        if parts == ["messages"] and method == "GET":
+            return self._list_messages(query)
+        if parts[0] == "messages" and len(parts) == 2:  # noqa: PLR2004
+            return self._get_message(parts[1], query)
+        if parts[0] == "messages" and parts[2:] == ["modify"]:
+            return self._modify_message(parts[1], payload)
+        if parts[0] == "threads" and parts[2:] == ["modify"]:
+            return self._modify_thread(parts[1], payload)
+        if parts == ["labels"]:
+            return self._list_labels()
+        return self._response(
+            404,
+            {"error": {"code": 404, "message": f"No route {path}"}},
+        )
+
+    def _list_messages(self, query: dict) -> tuple:
+        """messages.list"""
+        start = int(query.get("pageToken", 0))
+        size = int(query.get("maxResults", self.page_size))
+        end = min(start + size, self.factory.count)
+        content = {
+            "messages": [
+                {
+                    "id": self.factory.message_id(index),
+                    "threadId": self.factory.thread_id(index),
+                }
+                for index in range(start, end)
+            ],
+            "resultSizeEstimate": self.factory.count,
+        }
+        if end < self.factory.count:
+            content["nextPageToken"] = str(end)
+        return self._response(200, content)
+
+    def _exists(self, message_id: str) -> bool:
+        """Check whether a message id is in the mailbox."""
+        try:
+            return 0 <= self.factory.index(message_id) < self.factory.count
+        except ValueError:
+            return False
+
+    def _not_found(self) -> tuple:
+        """404 response."""
+        return self._response(
+            404,
+            {"error": {"code": 404, "message": "Requested entity was not found."}},
+        )
+
+    def _get_message(self, message_id: str, query: dict) -> tuple:
+        """messages.get"""
+        if not self._exists(message_id):
+            return self._not_found()
+        index = self.factory.index(message_id)
+        return self._response(
+            200,
+            self.factory.message(index, query.get("format", "full")),
+        )
+
+    def _modify_message(self, message_id: str, payload: dict) -> tuple:
+        """messages.modify"""
+        if not self._exists(message_id):
+            return self._not_found()
+        with self._lock:
+            self.label_changes[message_id] = (
+                payload.get("addLabelIds", []),
+                payload.get("removeLabelIds", []),
+            )
+        return self._response(
+            200,
+            self.factory.message(
+                self.factory.index(message_id),
+                "minimal",
+            ),
+        )
+
+    def _thread_messages(self, thread_id: str) -> list[int]:
+        """Indexes of the messages in a thread."""
+        try:
+            start = int(thread_id.removeprefix("t"), 16)
+        except ValueError:
+            return []
+        return [
+            index
+            for index in range(start, min(start + 4, self.factory.count))
+            if self.factory.thread_index(index) == start
+        ]
+
+    def _modify_thread(self, thread_id: str, payload: dict) -> tuple:
+        """threads.modify"""
+        indexes = self._thread_messages(thread_id)
+        if not indexes:
+            return self._not_found()
+        with self._lock:
+            for index in indexes:
+                self.label_changes[self.factory.message_id(index)] = (
+                    payload.get("addLabelIds", []),
+                    payload.get("removeLabelIds", []),
+                )
+        return self._response(
+            200,
+            {
+                "id": thread_id,
+                "messages": [
+                    self.factory.message(index, "minimal")
+                    for index in indexes
+                ],
+            },
+        )
+
+    def _list_labels(self) -> tuple:
+        """labels.list"""
+        labels = [
+            {"id": label, "name": label, "type": "system"}
+            for label in SYSTEM_LABELS
+        ]
+        labels.append({"id": "Label_1", "name": "Receipts", "type": "user"})
+        return self._response(200, {"labels": labels})
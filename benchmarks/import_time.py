@@ -0,0 +1,101 @@
+"""Import-time benchmark for the CLI entrypoint.
+
+Runs the interpreter with ``-X importtime`` and fails when the import
+cost above a bare interpreter exceeds the budget of a scenario.
+
+Usage::
+
+    python benchmarks/import_time.py [--repeat 5] [--scale 1.0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Budgets are in milliseconds of cumulative import time on top of a
+# bare ``python -c pass``.
+SCENARIOS: dict[str, tuple[list[str], float]] = {
+    "help": (["-m", "mail_processor", "--help"], 50.0),
+    # NOTE: What the labels subcommand imports, GMail is only imported
+    # when the label cache is stale.
+    "labels": (
+        [
+            "-c",
+            "import mail_processor.__main__, mail_processor.label_cache, "
+            "mail_processor.models",
+        ],
+        350.0,
+    ),
+}
+
+DUMMY_ENV = {
+    "CREDENTIALS_JSON_PATH": ".secrets/credentials.json",
+    "TOKEN_JSON_PATH": ".secrets/token.json",
+    "SQLITE_DB": ".data/db.sqlite",
+}
+
+
+def import_time_ms(args: list[str]) -> float:
+    """Return the summed top level cumulative import time."""
+    env = {**DUMMY_ENV, **os.environ}
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip() == "cumulative":
+            continue
+        # Nested imports are indented, they are already part of the
+        # cumulative time of their top level import.
+        if name.startswith("  "):
+            continue
+        total_us += int(cumulative)
+    return total_us / 1000
+
+
+def measure(args: list[str], repeat: int) -> float:
+    """Median import time over ``repeat`` runs."""
+    return statistics.median(import_time_ms(args) for _ in range(repeat))
+
+
+def main() -> int:
+    """Run all the scenarios and compare against the budgets."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the budgets, useful on slow machines.",
+    )
+    args = parser.parse_args()
+
+    baseline = measure(["-c", "pass"], args.repeat)
+    failed = False
+    for name, (scenario_args, budget) in SCENARIOS.items():
+        elapsed = measure(scenario_args, args.repeat) - baseline
+        budget *= args.scale
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        failed = failed or elapsed > budget
+        print(f"{name:<8} {elapsed:8.1f} ms  (budget {budget:.0f} ms)  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""Offline benchmark suite against the fake GMail server.
+
+Each scenario runs in a fresh process with its own temporary database,
+so singletons and peak RSS do not leak between scenarios. Results are
+written as JSON which ``benchmarks/compare.py`` can diff across commits.
+
+Usage::
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --scenarios sync --messages 5000 \\
+        --latency 0.005 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import UTC, datetime
+from pathlib import Path
+from queue import Empty
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Seconds between checks that a scenario's process is still alive.
+POLL_INTERVAL = 1.0
+
+# Representative rules, evaluated with the real rule engine.
+RULES = [
+    {
+        "name": "sender equals",
+        "predicate": "all",
+        "conditions": [
+            {
+                "field_name": "From",
+                "predicate": "equals",
+                "value": "sender1@mail.example.org",
+            },
+        ],
+        "actions": [{"type": "Mark as Read"}],
+    },
+    {
+        "name": "subject contains",
+        "predicate": "all",
+        "conditions": [
+            {
+                "field_name": "Subject",
+                "predicate": "contains",
+                "value": "invoice",
+            },
+        ],
+        "actions": [{"type": "Mark as Read"}],
+    },
+    {
+        "name": "recent",
+        "predicate": "all",
+        "conditions": [
+            {
+                "field_name": "Date",
+                "predicate": "less than",
+                "value": 30,
+                "unit": "days",
+            },
+        ],
+        "actions": [{"type": "Mark as Read"}],
+    },
+    {
+        "name": "body and sender",
+        "predicate": "all",
+        "conditions": [
+            {
+                "field_name": "Body",
+                "predicate": "contains",
+                "value": "password",
+            },
+            {
+                "field_name": "From",
+                "predicate": "contains",
+                "value": "example.io",
+            },
+        ],
+        "actions": [{"type": "Mark as Read"}],
+    },
+    {
+        "name": "any of three",
+        "predicate": "any",
+        "conditions": [
+            {
+                "field_name": "Body",
+                "predicate": "contains",
+                "value": "discount",
+            },
+            {
+                "field_name": "Subject",
+                "predicate": "equals",
+                "value": "weekly digest",
+            },
+            {
+                "field_name": "From",
+                "predicate": "does not contain",
+                "value": "example",
+            },
+        ],
+        "actions": [{"type": "Mark as Read"}],
+    },
+]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # NOTE: Linux reports KiB, macOS reports bytes.
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def setup_environment(directory: str) -> None:
+    """Point the app at a throwaway database before it is imported."""
+    os.environ["CREDENTIALS_JSON_PATH"] = f"{directory}/credentials.json"
+    os.environ["TOKEN_JSON_PATH"] = f"{directory}/token.json"
+    os.environ["SQLITE_DB"] = f"{directory}/db.sqlite"
+
+    from mail_processor.logger import logger
+
+    logger.setLevel("WARNING")
+
+
+def install_fake(**kwargs: float) -> object:
+    """Make GMailServices talk to a fresh fake server."""
+    from fake_gmail import FakeGmailHttp
+
+    from mail_processor.services import GMailServices
+
+    fake = FakeGmailHttp(**kwargs)
+    GMailServices._instance = None  # noqa: SLF001
+    GMailServices(http=fake)
+    return fake
+
+
+def bench_sync(messages: int, latency: float, error_rate: float) -> dict:
+    """Full sync of a mailbox into an empty database."""
+    from mail_processor.models import initialize_models
+    from mail_processor.synchronizer import sync_emails
+
+    initialize_models()
+    fake = install_fake(
+        count=messages,
+        latency=latency,
+        error_rate=error_rate,
+    )
+
+    start = time.perf_counter()
+    sync_emails()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "messages": messages,
+        "seconds": elapsed,
+        "msgs_per_sec": messages / elapsed,
+        "api_calls": dict(fake.calls),
+        "throttled": fake.errors,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def populate(rows: int, batch_size: int = 10_000) -> None:
+    """Insert synthetic messages straight into the database."""
+    import random
+
+    from fake_gmail import MessageFactory
+
+    from mail_processor.models.message import Message
+
+    factory = MessageFactory(rows)
+    rng = random.Random(0)
+    # NOTE: Pools keep generation cheap, the scan cost is the same.
+    bodies = [factory.text(rng, factory.body_words) for _ in range(1000)]
+    subjects = [factory.text(rng, 6) for _ in range(1000)]
+    for start in range(0, rows, batch_size):
+        Message.bulk_insert(
+            [
+                Message(
+                    message_id=factory.message_id(index),
+                    thread_id=factory.thread_id(index),
+                    from_=factory.sender(index)[1],
+                    to="me@example.com",
+                    subject=subjects[index % len(subjects)],
+                    date=factory.date(index).isoformat(),
+                    body=bodies[index % len(bodies)],
+                )
+                for index in range(start, min(start + batch_size, rows))
+            ],
+        )
+
+
+def bench_rules(rows: int, repeat: int) -> dict:
+    """Latency of evaluating each rule against ``rows`` messages."""
+    from mail_processor.models import Statistics, initialize_models
+    from mail_processor.rule_engine import filter_messages
+    from mail_processor.rule_engine.schema import RuleSchema
+
+    initialize_models()
+    start = time.perf_counter()
+    populate(rows)
+    populate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    message_statistics = Statistics.refresh()
+    statistics_seconds = time.perf_counter() - start
+
+    results = {}
+    for rule in RULES:
+        rule_obj = RuleSchema(**rule)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            matches = len(filter_messages(rule_obj, message_statistics))
+            timings.append(time.perf_counter() - start)
+        results[rule["name"]] = {
+            "matches": matches,
+            "median_ms": statistics.median(timings) * 1000,
+            "min_ms": min(timings) * 1000,
+        }
+
+    return {
+        "rows": rows,
+        "populate_seconds": populate_seconds,
+        "statistics_seconds": statistics_seconds,
+        "rules": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_actions(
+    messages: int,
+    latency: float,
+    error_rate: float,
+    scope: str = "message",
+) -> dict:
+    """Throughput of applying an action to ``messages`` messages.
+
+    The messages are stored first, like the synced messages a rule
+    matches, the executor updates their labels locally too.
+    """
+    from fake_gmail import MessageFactory
+
+    from mail_processor.models import initialize_models
+    from mail_processor.models.message import Message
+    from mail_processor.rule_engine import ActionExecutor
+    from mail_processor.rule_engine.schema import RuleSchema
+
+    initialize_models()
+    fake = install_fake(
+        count=messages,
+        latency=latency,
+        error_rate=error_rate,
+    )
+    factory = MessageFactory(messages)
+    filtered = [
+        Message(
+            message_id=factory.message_id(index),
+            thread_id=factory.thread_id(index),
+            from_=factory.sender(index)[1],
+            to="me@example.com",
+            subject="",
+            date=factory.date(index).isoformat(),
+            body="",
+            label_ids=["INBOX", "UNREAD"],
+        )
+        for index in range(messages)
+    ]
+    Message.bulk_insert(filtered)
+    rule_obj = RuleSchema(**RULES[0], scope=scope)
+
+    start = time.perf_counter()
+    ActionExecutor(rule_obj=rule_obj, filtered_messages=filtered).execute()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "messages": messages,
+        "seconds": elapsed,
+        "actions_per_sec": messages / elapsed,
+        "api_calls": dict(fake.calls),
+        "throttled": fake.errors,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_thread_actions(
+    messages: int,
+    latency: float,
+    error_rate: float,
+) -> dict:
+    """Same as ``actions``, through threads.modify."""
+    return bench_actions(messages, latency, error_rate, scope="thread")
+
+
+SCENARIOS = {
+    "sync": bench_sync,
+    "rules": bench_rules,
+    "actions": bench_actions,
+    "thread_actions": bench_thread_actions,
+}
+
+
+class ScenarioError(Exception):
+    """Raised when a scenario fails in its process."""
+
+
+def _worker(
+    scenario: str,
+    kwargs: dict,
+    queue: multiprocessing.Queue,
+) -> None:
+    """Run one scenario in a fresh process.
+
+    Puts the result, or the traceback of the failure, on the queue.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            setup_environment(directory)
+            queue.put({"result": SCENARIOS[scenario](**kwargs)})
+        except BaseException:
+            queue.put({"error": traceback.format_exc()})
+            raise SystemExit(1) from None
+
+
+def run_isolated(scenario: str, **kwargs: float) -> dict:
+    """Run a scenario in a spawned process and return its result.
+
+    :raises ScenarioError: If the scenario failed, or its process died
+        without a result.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_worker,
+        args=(scenario, kwargs, queue),
+    )
+    process.start()
+    try:
+        while True:
+            try:
+                outcome = queue.get(timeout=POLL_INTERVAL)
+                break
+            except Empty:
+                # NOTE: A process killed, e.g. by the OOM killer, never
+                # puts anything.
+                if not process.is_alive() and queue.empty():
+                    process.join()
+                    msg = (
+                        f"{scenario} exited with code {process.exitcode} "
+                        "without a result."
+                    )
+                    raise ScenarioError(msg) from None
+    finally:
+        process.join()
+
+    if "error" in outcome:
+        msg = f"{scenario} failed:\n{outcome['error']}"
+        raise ScenarioError(msg)
+    return outcome["result"]
+
+
+def git_commit() -> str | None:
+    """Commit the benchmark ran against."""
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return result.stdout.strip() or None
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Benchmark options."""
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks against a fake GMail.",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default="sync,rules,actions,thread_actions",
+        help="Comma separated scenarios to run.",
+    )
+    parser.add_argument("--messages", type=int, default=2_000)
+    parser.add_argument(
+        "--rows",
+        default="10000,100000,1000000",
+        help="Comma separated row counts for rule evaluation.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds of latency added to every API call.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability of an API call answering with a 429.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write JSON results here.")
+    return parser
+
+
+def main() -> None:
+    """Run the selected scenarios."""
+    args = get_parser().parse_args()
+    scenarios = args.scenarios.split(",")
+    results: dict = {}
+    failed = False
+
+    def run(name: str, scenario: str, **kwargs: float) -> dict:
+        """Run a scenario, a failure is reported and the others go on."""
+        nonlocal failed
+        try:
+            result = run_isolated(scenario, **kwargs)
+        except ScenarioError as e:
+            failed = True
+            print(f"{name}: {e}", file=sys.stderr)
+            return {"error": str(e)}
+        print(f"{name}: {json.dumps(result, indent=2)}")
+        return result
+
+    for scenario in ("sync", "actions", "thread_actions"):
+        if scenario in scenarios:
+            results[scenario] = run(
+                scenario,
+                scenario,
+                messages=args.messages,
+                latency=args.latency,
+                error_rate=args.error_rate,
+            )
+
+    if "rules" in scenarios:
+        results["rules"] = {}
+        for rows in map(int, args.rows.split(",")):
+            results["rules"][str(rows)] = run(
+                f"rules[{rows}]",
+                "rules",
+                rows=rows,
+                repeat=args.repeat,
+            )
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(args),
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,148 @@
 #!/usr/bin/env python
 
-"""Entrypoint for the cli application."""
+"""Entrypoint for the cli application.
 
-from mail_processor.authenticate import (
-    store_credentials,
-)
-from mail_processor.cli import get_parser
-from mail_processor.logger import logger
-from mail_processor.models import initialize_models
-from mail_processor.rule_engine import execute_rules
-from mail_processor.services import GMailServices
-from mail_processor.synchronizer import sync_emails
+Heavy dependencies (googleapiclient, google_auth_oauthlib, rich and
+pydantic) are imported inside the subcommand that needs them so that
+``--help`` and light subcommands start without paying for them.
+"""
 
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
 
-def main() -> None:
-    """Entry point to app."""
-    initialize_models()
+from mail_processor.cli import get_parser
+from mail_processor.logger import logger
 
-    parser = get_parser()
-    args = parser.parse_args()
 
+def run_subcommand(parser: ArgumentParser, args: Namespace) -> None:
+    """Run the selected subcommand."""
     if args.subcommand == "auth":
+        from mail_processor.authenticate import store_credentials
+
         store_credentials()
     elif args.subcommand == "sync":
+        from mail_processor.models import initialize_models
+        from mail_processor.synchronizer import sync_emails
+
+        initialize_models()
         sync_emails(refresh=args.refresh)
     elif args.subcommand == "labels":
-        logger.info(GMailServices().get_labels())
+        from mail_processor.label_cache import get_labels
+        from mail_processor.models import initialize_models
+
+        initialize_models()
+        for label in get_labels(refresh=args.refresh):
+            logger.info(f"{label.name}: {label.label_id}")
     elif args.subcommand == "execute":
+        from mail_processor.models import initialize_models
+        from mail_processor.rule_engine import execute_rules
+
+        initialize_models()
         execute_rules(args.file_path)
+    elif args.subcommand == "backtest":
+        from mail_processor.models import initialize_models
+        from mail_processor.rule_engine.backtest import (
+            backtest_rules,
+            print_report,
+        )
+
+        initialize_models()
+        reports = backtest_rules(args.file_path)
+        if reports is not None:
+            print_report(reports, as_json=args.json)
+    elif args.subcommand == "retention":
+        from mail_processor.models import initialize_models
+        from mail_processor.retention import run_retention
+
+        initialize_models()
+        run_retention()
+    elif args.subcommand == "senders":
+        from mail_processor.models import initialize_models
+        from mail_processor.senders import get_senders, print_senders
+
+        initialize_models()
+        print_senders(
+            get_senders(args.limit, args.sort, by_domain=args.by_domain),
+            by_domain=args.by_domain,
+            as_json=args.json,
+        )
     else:
         parser.print_help()
 
 
+def run(parser: ArgumentParser, args: Namespace) -> None:
+    """Run the subcommand for the default account or the selected ones."""
+    if not args.accounts and not args.all_accounts:
+        run_subcommand(parser, args)
+        return
+
+    from mail_processor.accounts import (
+        activate_account,
+        is_valid_account_name,
+        run_accounts,
+    )
+    from mail_processor.config import app_config
+
+    accounts = list(
+        dict.fromkeys(
+            (app_config.ACCOUNTS if args.all_accounts else [])
+            + (args.accounts or []),
+        ),
+    )
+    if not accounts:
+        parser.error("No accounts configured in ACCOUNTS.")
+    for account in accounts:
+        if not is_valid_account_name(account):
+            parser.error(f"Invalid account name: {account!r}")
+
+    if len(accounts) == 1:
+        activate_account(accounts[0])
+        run_subcommand(parser, args)
+        return
+
+    if args.subcommand == "auth":
+        parser.error("auth takes a single account.")
+
+    options = {"refresh": getattr(args, "refresh", False)}
+    if args.subcommand in {"execute", "backtest"}:
+        options["file_path"] = str(Path(args.file_path).resolve())
+    if args.subcommand in {"backtest", "senders"}:
+        options["json"] = args.json
+    if args.subcommand == "senders":
+        options.update(
+            limit=args.limit,
+            sort=args.sort,
+            by_domain=args.by_domain,
+        )
+    results = run_accounts(accounts, args.subcommand, options)
+    if any(result["error"] for result in results):
+        raise SystemExit(1)
+
+
+def main() -> None:
+    """Entry point to app."""
+    parser = get_parser()
+    args = parser.parse_args()
+
+    try:
+        if args.profile:
+            import cProfile
+
+            with cProfile.Profile() as profiler:
+                try:
+                    run(parser, args)
+                finally:
+                    profiler.dump_stats(args.profile)
+                    logger.info(f"Profile stats written to {args.profile}")
+        else:
+            run(parser, args)
+    finally:
+        if args.metrics:
+            from mail_processor.metrics import metrics
+
+            metrics.write(args.metrics, args.metrics_file)
+
+
 if __name__ == "__main__":
     try:
         main()
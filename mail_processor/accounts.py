@@ -0,0 +1,194 @@
+"""Multiple GMail accounts.
+
+Every account has its own token and database shard below
+``ACCOUNTS_DIR/<name>/``. ``GMailServices``, ``SQLiteConnection`` and
+the ``metrics`` registry are process wide singletons, so every account
+runs in a fresh process of a pool, all drawing from one shared quota
+limiter. Their results and metrics are aggregated into a single report.
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from mail_processor.config import app_config
+from mail_processor.logger import logger
+from mail_processor.metrics import metrics
+from mail_processor.ratelimit import QuotaLimiter, install_limiter
+
+__all__ = [
+    "activate_account",
+    "is_valid_account_name",
+    "run_accounts",
+]
+
+_account_regex = re.compile(r"[\w.@+-]+")
+
+
+def is_valid_account_name(name: str) -> bool:
+    """Account names are used as directory names."""
+    return bool(_account_regex.fullmatch(name)) and name not in {".", ".."}
+
+
+def activate_account(name: str) -> None:
+    """Point the token and database of this process at the account.
+
+    Must run before the first GMail call or database access.
+    """
+    directory = Path(app_config.ACCOUNTS_DIR) / name
+    app_config.TOKEN_JSON_PATH = directory / "token.json"
+    app_config.SQLITE_DB = directory / "db.sqlite"
+
+
+def _init_worker(limiter: QuotaLimiter) -> None:
+    """Install the shared quota limiter in a worker process."""
+    install_limiter(limiter)
+
+
+def _run_account(name: str, subcommand: str, options: dict) -> dict:
+    """Run a subcommand for one account, inside a worker process.
+
+    Reports are returned as the ``output``, for the parent process to
+    print them together.
+    """
+    activate_account(name)
+    start = time.perf_counter()
+    error = None
+    output = None
+    try:
+        from mail_processor.models import initialize_models
+
+        initialize_models()
+        if subcommand == "sync":
+            from mail_processor.synchronizer import sync_emails
+
+            sync_emails(refresh=options["refresh"])
+        elif subcommand == "execute":
+            from mail_processor.rule_engine import execute_rules
+
+            execute_rules(options["file_path"])
+        elif subcommand == "backtest":
+            from mail_processor.rule_engine.backtest import backtest_rules
+
+            output = backtest_rules(options["file_path"])
+        elif subcommand == "retention":
+            from mail_processor.retention import run_retention
+
+            run_retention()
+        elif subcommand == "senders":
+            from mail_processor.senders import get_senders
+
+            output = get_senders(
+                options["limit"],
+                options["sort"],
+                by_domain=options["by_domain"],
+            )
+        elif subcommand == "labels":
+            from mail_processor.label_cache import get_labels
+
+            for label in get_labels(refresh=options["refresh"]):
+                logger.info(f"[{name}] {label.name}: {label.label_id}")
+    except Exception as e:  # noqa: BLE001
+        logger.exception(f"[{name}] {subcommand} failed")
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "account": name,
+        "seconds": time.perf_counter() - start,
+        "error": error,
+        "output": output,
+        "metrics": metrics.snapshot(),
+    }
+
+
+def run_accounts(
+    accounts: list[str],
+    subcommand: str,
+    options: dict,
+) -> list[dict]:
+    """Run a subcommand for every account in a process pool.
+
+    :return: the result of every account.
+    """
+    context = multiprocessing.get_context("spawn")
+    limiter = QuotaLimiter(
+        app_config.GLOBAL_QUOTA_UNITS_PER_SECOND,
+        context=context,
+    )
+    results = []
+    # NOTE: A reused worker would keep the previous account's database,
+    # credentials and cumulative metrics, one process per account.
+    with ProcessPoolExecutor(
+        max_workers=min(app_config.MAX_PARALLEL_ACCOUNTS, len(accounts)),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(limiter,),
+        max_tasks_per_child=1,
+    ) as executor:
+        futures = [
+            executor.submit(_run_account, account, subcommand, options)
+            for account in accounts
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            metrics.merge(result["metrics"])
+            results.append(result)
+
+    results.sort(key=lambda result: result["account"])
+    print_outputs(results, subcommand, options)
+    report(results)
+    return results
+
+
+def print_outputs(results: list[dict], subcommand: str, options: dict) -> None:
+    """Print the reports of the accounts, as one JSON document by account."""
+    outputs = {
+        result["account"]: result["output"]
+        for result in results
+        if result["output"] is not None
+    }
+    if not outputs:
+        return
+    if options.get("json"):
+        print(json.dumps(outputs, indent=2))  # noqa: T201
+        return
+
+    if subcommand == "backtest":
+        from mail_processor.rule_engine.backtest import print_report
+
+        for name, reports in outputs.items():
+            print_report(reports, title=f"Backtest of {name}")
+    elif subcommand == "senders":
+        from mail_processor.senders import print_senders
+
+        title = "Domains" if options["by_domain"] else "Senders"
+        for name, senders in outputs.items():
+            print_senders(
+                senders,
+                by_domain=options["by_domain"],
+                title=f"{title} of {name}",
+            )
+
+
+def report(results: list[dict]) -> None:
+    """Log one line per account and the totals."""
+    for result in results:
+        api = result["metrics"]["api"].values()
+        status = result["error"] or "ok"
+        logger.info(
+            f"{result['account']}: {status} in {result['seconds']:.1f}s, "
+            f"{sum(method['calls'] for method in api)} API calls, "
+            f"{sum(method['quota_units'] for method in api)} quota units",
+        )
+
+    failed = sum(1 for result in results if result["error"])
+    logger.info(
+        f"{len(results) - failed} of {len(results)} accounts succeeded, "
+        f"{sum(metrics.api_calls.values())} API calls, "
+        f"{sum(metrics.quota_units.values())} quota units in total.",
+    )
@@ -1,18 +1,119 @@
 """Authenticate GMail."""
 
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import UTC, datetime
 from pathlib import Path
+from typing import IO, Iterator
 
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 
 from mail_processor.config import app_config
 from mail_processor.constants import (
     SCOPES,
+    TOKEN_REFRESH_MARGIN,
 )
 from mail_processor.errors import NoAuthenticationError
 from mail_processor.logger import logger
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(fp: IO) -> None:
+    """Block until an exclusive lock is held on the file."""
+    if fcntl:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+    else:  # pragma: no cover - Windows
+        msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(fp: IO) -> None:
+    """Release the lock held on the file."""
+    if fcntl:
+        fcntl.flock(fp, fcntl.LOCK_UN)
+    else:  # pragma: no cover - Windows
+        msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def token_lock() -> Iterator[None]:
+    """Hold an exclusive, cross process lock on the token file."""
+    lock_path = Path(f"{app_config.TOKEN_JSON_PATH}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open("a") as lock_file:
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+def write_token(credentials: Credentials) -> None:
+    """Atomically write the credentials to ``TOKEN_JSON_PATH``.
+
+    The token is written to a temporary file in the same directory and
+    renamed over the old one, so readers never see a partial file.
+    """
+    token_path = Path(app_config.TOKEN_JSON_PATH)
+    token_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=token_path.parent,
+        prefix=f".{token_path.name}.",
+    )
+    try:
+        with os.fdopen(fd, "w") as token:
+            token.write(credentials.to_json())
+            token.flush()
+            os.fsync(token.fileno())
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def needs_refresh(credentials: Credentials) -> bool:
+    """Check whether the credentials expire within the refresh margin."""
+    if not credentials.expiry:
+        return False
+    now = datetime.now(UTC).replace(tzinfo=None)
+    return credentials.expiry - TOKEN_REFRESH_MARGIN <= now
+
+
+def refresh_credentials(credentials: Credentials) -> Credentials:
+    """Refresh the credentials and persist the new token.
+
+    Another process may have refreshed the token while we waited for
+    the lock, in which case its token is adopted instead of refreshing
+    again.
+    """
+    from google.auth.transport.requests import Request
+
+    with token_lock():
+        stored = Credentials.from_authorized_user_file(
+            app_config.TOKEN_JSON_PATH,
+            SCOPES,
+        )
+        if stored.token != credentials.token and not needs_refresh(
+            stored,
+        ):
+            credentials.token = stored.token
+            credentials.expiry = stored.expiry
+            return credentials
+
+        credentials.refresh(Request())
+        write_token(credentials)
+        logger.debug(f"Refreshed token, expires at {credentials.expiry}")
+
+    return credentials
+
 
 def store_credentials() -> None:
     """Store Credentials."""
@@ -22,14 +123,17 @@ def store_credentials() -> None:
         logger.info("Already authenticated.")
         return
 
+    # NOTE: Imported lazily, only the auth subcommand needs the flow.
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     flow = InstalledAppFlow.from_client_secrets_file(
         app_config.CREDENTIALS_JSON_PATH,
         SCOPES,
     )
-    flow.run_local_server(port=0)
+    credentials = flow.run_local_server(port=0)
 
-    with Path.open(app_config.TOKEN_JSON_PATH, "w") as token:
-        token.write(Credentials.to_json())
+    with token_lock():
+        write_token(credentials)
 
 
 def get_credentials() -> Credentials:
@@ -48,9 +152,50 @@ def get_credentials() -> Credentials:
 
     if (
         credentials
-        and credentials.expired
+        and needs_refresh(credentials)
         and credentials.refresh_token
     ):
-        credentials.refresh(Request())
+        refresh_credentials(credentials)
 
     return credentials
+
+
+class CredentialsRefresher(threading.Thread):
+    """Refresh credentials in the background before they expire.
+
+    Long runs would otherwise block an in-flight request on the
+    refresh round trip once the access token expires.
+    """
+
+    def __init__(self, credentials: Credentials) -> None:
+        """Initialize the refresher thread."""
+        super().__init__(name="credentials-refresher", daemon=True)
+        self.credentials = credentials
+        self._stopped = threading.Event()
+
+    def _seconds_until_refresh(self) -> float | None:
+        """Seconds to wait before the next refresh."""
+        if not self.credentials.expiry:
+            return None
+        refresh_at = self.credentials.expiry - TOKEN_REFRESH_MARGIN
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return max((refresh_at - now).total_seconds(), 0)
+
+    def run(self) -> None:
+        """Refresh the token until stopped."""
+        while not self._stopped.is_set():
+            if not self.credentials.refresh_token:
+                return
+            timeout = self._seconds_until_refresh()
+            if self._stopped.wait(timeout):
+                return
+            try:
+                refresh_credentials(self.credentials)
+            except Exception:  # noqa: BLE001
+                logger.warning("Background token refresh failed.")
+                # NOTE: Let the next request refresh on demand.
+                self._stopped.wait(TOKEN_REFRESH_MARGIN.total_seconds())
+
+    def stop(self) -> None:
+        """Stop refreshing."""
+        self._stopped.set()
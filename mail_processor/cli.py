@@ -13,6 +13,48 @@ def get_parser() -> ArgumentParser:
         ),
     )
 
+    parser.add_argument(
+        "--metrics",
+        choices=["json", "prometheus"],
+        dest="metrics",
+        help=(
+            "Emit run metrics at the end of the run, as a JSON summary "
+            "or in the Prometheus text format."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        help=(
+            "Write the metrics to this file instead of stderr, e.g. "
+            "into the node exporter's textfile directory."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="STATS_FILE",
+        help="Run the subcommand under cProfile and dump the stats.",
+    )
+
+    parser.add_argument(
+        "-a",
+        "--account",
+        action="append",
+        dest="accounts",
+        metavar="NAME",
+        help=(
+            "Run for the named account, repeat for several accounts. "
+            "Defaults to the single account configured in .env."
+        ),
+    )
+    parser.add_argument(
+        "--all-accounts",
+        action="store_true",
+        dest="all_accounts",
+        help="Run for every account listed in ACCOUNTS.",
+    )
+
     subparsers = parser.add_subparsers(
         dest="subcommand",
         required=True,
@@ -34,10 +76,17 @@ def get_parser() -> ArgumentParser:
         dest="refresh",
         help="Clear all the old message and sync.",
     )
-    subparsers.add_parser(
+    labels_parser = subparsers.add_parser(
         "labels",
         description="List all the labels",
     )
+    labels_parser.add_argument(
+        "-r",
+        "--refresh",
+        action="store_true",
+        dest="refresh",
+        help="Refresh the local label cache from gmail.",
+    )
     execute_parser = subparsers.add_parser(
         "execute",
         description="Execute the given rule",
@@ -47,5 +96,61 @@ def get_parser() -> ArgumentParser:
         "file_path",
         help="Relative or absolute path to the rules json.",
     )
+    backtest_parser = subparsers.add_parser(
+        "backtest",
+        description=(
+            "Evaluate the given rules against the local database only, "
+            "without executing any action"
+        ),
+    )
+    backtest_parser.add_argument(
+        "file_path",
+        help="Relative or absolute path to the rules json.",
+    )
+    backtest_parser.add_argument(
+        "--json",
+        action="store_true",
+        dest="json",
+        help="Print the report as JSON.",
+    )
+    subparsers.add_parser(
+        "retention",
+        description=(
+            "Drop old bodies, cap the database size and give the freed "
+            "space back, as configured by the RETENTION_* settings"
+        ),
+    )
+    senders_parser = subparsers.add_parser(
+        "senders",
+        description=(
+            "List the senders with the most messages, to find the ones "
+            "which deserve a rule"
+        ),
+    )
+    senders_parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of senders to list.",
+    )
+    senders_parser.add_argument(
+        "--sort",
+        choices=["messages", "unread", "recent"],
+        default="messages",
+        help="Sort by message count, unread count or last seen.",
+    )
+    senders_parser.add_argument(
+        "--by-domain",
+        action="store_true",
+        dest="by_domain",
+        help="Aggregate the senders by domain.",
+    )
+    senders_parser.add_argument(
+        "--json",
+        action="store_true",
+        dest="json",
+        help="Print the report as JSON.",
+    )
 
     return parser
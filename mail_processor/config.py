@@ -15,6 +15,36 @@ class Settings(BaseSettings):
 
     SQLITE_DB: Path
 
+    # Named accounts, e.g. '["me", "support"]'. Each one keeps its token
+    # and database below ACCOUNTS_DIR/<name>/.
+    ACCOUNTS: list[str] = []
+    ACCOUNTS_DIR: Path = Path(".data/accounts")
+    # Accounts processed in parallel, and the quota units per second
+    # they may use together.
+    MAX_PARALLEL_ACCOUNTS: int = 4
+    GLOBAL_QUOTA_UNITS_PER_SECOND: float = 1000
+
+    # Sync pipeline: concurrent message fetches, size of the bounded
+    # queues between the stages and messages written per transaction.
+    SYNC_FETCH_WORKERS: int = 8
+    SYNC_QUEUE_SIZE: int = 256
+    SYNC_WRITE_BATCH_SIZE: int = 100
+
+    # Retention, applied after every sync: bodies of messages older than
+    # RETENTION_BODY_DAYS are dropped, keeping the headers, and the
+    # oldest bodies then messages are evicted above RETENTION_MAX_DB_MB.
+    # Messages deleted upstream are evicted unless disabled.
+    RETENTION_BODY_DAYS: int | None = None
+    RETENTION_MAX_DB_MB: float | None = None
+    RETENTION_EVICT_DELETED: bool = True
+
+    # Seconds before the local label cache is refreshed from GMail.
+    LABEL_CACHE_TTL: int = 3600
+
+    # Optional local copy of the Gmail discovery document. When unset
+    # the static copy packaged with googleapiclient is used.
+    DISCOVERY_DOC_PATH: Path | None = None
+
     model_config = SettingsConfigDict(env_file=".env")
 
 
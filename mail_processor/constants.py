@@ -1,3 +1,31 @@
 """Constants."""
 
+from datetime import timedelta
+
 SCOPES = ["https://mail.google.com/"]
+
+# Refresh access tokens this long before they expire. Kept above
+# google-auth's own refresh threshold so a request never has to
+# refresh inline.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Retries for rate limited (429) and server errors, with exponential
+# backoff. Every retry takes its quota units from the rate limiter.
+API_NUM_RETRIES = 5
+
+# Requests per batch call, GMail advises against more than 50.
+BATCH_SIZE = 50
+
+# Quota units charged per GMail API method, see
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    "history.list": 2,
+    "labels.list": 1,
+    "messages.batchModify": 50,
+    "messages.get": 5,
+    "messages.list": 5,
+    "messages.modify": 5,
+    "threads.get": 10,
+    "threads.modify": 10,
+    "users.getProfile": 1,
+}
@@ -2,31 +2,130 @@
 
 import sqlite3
 import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Self
+from typing import Any, Iterator, Self
 
 from mail_processor.config import app_config
+from mail_processor.database.functions import register_functions
+from mail_processor.metrics import metrics, statement_name
 
 __all__ = ["sqlite_connection"]
 
+# Seconds to wait on a lock held by another process before failing.
+SQLITE_BUSY_TIMEOUT = 30
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor recording the time spent per statement in the metrics.
+
+    Fetches are attributed to the statement that produced the rows,
+    SQLite does most of the work of a SELECT while stepping through
+    them.
+    """
+
+    _statement = "UNKNOWN"
+
+    def execute(self, sql: str, parameters: Any = (), /) -> Self:  # noqa: ANN401
+        """Execute a statement."""
+        self._statement = statement_name(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_sql(self._statement, time.perf_counter() - start)
+
+    def executemany(self, sql: str, seq_of_parameters: Any, /) -> Self:  # noqa: ANN401
+        """Execute a statement for every parameter set."""
+        self._statement = statement_name(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_sql(self._statement, time.perf_counter() - start)
+
+    def fetchone(self) -> Any:  # noqa: ANN401
+        """Fetch a row."""
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            metrics.record_sql(self._statement, time.perf_counter() - start)
+
+    def fetchall(self) -> list[Any]:
+        """Fetch the remaining rows."""
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            metrics.record_sql(self._statement, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection handing out ``TimedCursor``'s.
+
+    The shortcut methods of ``sqlite3.Connection`` create their cursor
+    without going through ``cursor()``, they are routed to a timed one.
+    """
+
+    def cursor(self, factory: type = TimedCursor) -> sqlite3.Cursor:
+        """Get a timed cursor."""
+        return super().cursor(factory)
+
+    def execute(
+        self,
+        sql: str,
+        parameters: Any = (),  # noqa: ANN401
+        /,
+    ) -> sqlite3.Cursor:
+        """Execute a statement on a new timed cursor."""
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(
+        self,
+        sql: str,
+        seq_of_parameters: Any,  # noqa: ANN401
+        /,
+    ) -> sqlite3.Cursor:
+        """Execute a statement for every parameter set on a new cursor."""
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str, /) -> sqlite3.Cursor:
+        """Execute a script, timed as its first statement."""
+        start = time.perf_counter()
+        try:
+            return self.cursor().executescript(sql_script)
+        finally:
+            metrics.record_sql(
+                statement_name(sql_script),
+                time.perf_counter() - start,
+            )
+
 
 class SQLiteConnection:
-    """SQLite Connection Singleton."""
+    """SQLite Connection Singleton.
+
+    The database runs in WAL mode with:
+
+    - one writer connection shared by all threads, serialized by a lock
+      and committed when the outermost ``writer()`` block exits.
+    - one read-only connection per thread, readers see the last
+      committed state and never block on, or get blocked by, the writer.
+
+    Connections are opened lazily on first use.
+    """
 
     _instance = None
     _lock = threading.Lock()
 
     def __init__(self) -> None:
-        """Initialize the GMail Service."""
-        if self._instance is self:
-            Path(app_config.SQLITE_DB).parent.mkdir(
-                parents=True,
-                exist_ok=True,
-            )
-            self.connection = sqlite3.connect(
-                app_config.SQLITE_DB,
-            )
-            self.cursor = self.connection.cursor()
+        """Initialize the SQLite Connection."""
+        if self._instance is self and not hasattr(self, "_local"):
+            self._local = threading.local()
+            self._write_lock = threading.RLock()
+            self._write_depth = 0
+            self._writer: sqlite3.Connection | None = None
 
     def __new__(cls) -> Self:
         """Singleton instance."""
@@ -37,21 +136,85 @@ class SQLiteConnection:
 
         return cls._instance
 
-    def get_connection(self) -> sqlite3.Connection:
-        """Get Connection."""
-        return self.connection
+    def _get_writer(self) -> sqlite3.Connection:
+        """Open the writer connection, creating the database if needed."""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    Path(app_config.SQLITE_DB).parent.mkdir(
+                        parents=True,
+                        exist_ok=True,
+                    )
+                    connection = sqlite3.connect(
+                        app_config.SQLITE_DB,
+                        timeout=SQLITE_BUSY_TIMEOUT,
+                        check_same_thread=False,
+                        factory=TimedConnection,
+                    )
+                    # NOTE: Only takes effect on a new database, existing
+                    # ones are switched over by a migration.
+                    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    connection.execute("PRAGMA journal_mode = WAL")
+                    connection.execute("PRAGMA synchronous = NORMAL")
+                    register_functions(connection)
+                    self._writer = connection
+        return self._writer
 
-    def get_cursor(self) -> sqlite3.Cursor:
-        """Get Cursor."""
-        return self.cursor
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Hold the writer connection.
 
-    def commit(self) -> None:
-        """Commit to DB."""
-        self.connection.commit()
+        Writes are serialized across threads, the transaction is
+        committed when the outermost block exits and rolled back on an
+        exception.
+        """
+        with self._write_lock:
+            connection = self._get_writer()
+            self._write_depth += 1
+            try:
+                yield connection
+            except BaseException:
+                if self._write_depth == 1:
+                    connection.rollback()
+                raise
+            else:
+                if self._write_depth == 1:
+                    connection.commit()
+            finally:
+                self._write_depth -= 1
+
+    def reader(self) -> sqlite3.Connection:
+        """Get the calling thread's read-only connection."""
+        connection = getattr(self._local, "reader", None)
+        if connection is None:
+            # NOTE: The writer creates the database and switches it to
+            # WAL, a read-only connection can do neither.
+            self._get_writer()
+            uri = Path(app_config.SQLITE_DB).resolve().as_uri()
+            connection = sqlite3.connect(
+                f"{uri}?mode=ro",
+                uri=True,
+                timeout=SQLITE_BUSY_TIMEOUT,
+                factory=TimedConnection,
+            )
+            register_functions(connection)
+            self._local.reader = connection
+        return connection
 
     def close(self) -> None:
-        """Close connection."""
-        self.connection.close()
+        """Close the calling thread's read-only connection."""
+        connection = getattr(self._local, "reader", None)
+        if connection is not None:
+            connection.close()
+            self._local.reader = None
+
+    def close_all(self) -> None:
+        """Close the writer and the calling thread's reader."""
+        self.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
 
 
 sqlite_connection = SQLiteConnection()
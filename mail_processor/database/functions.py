@@ -0,0 +1,33 @@
+"""SQL functions registered on every connection."""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+from functools import lru_cache
+
+__all__ = ["compile_pattern", "register_functions"]
+
+# Compiled patterns kept, rules use a handful of them.
+PATTERN_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Compile a pattern, case-insensitive like the other predicates.
+
+    :raises re.error: If the pattern is invalid.
+    """
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def regexp(pattern: str, value: str | None) -> bool | None:
+    """``value REGEXP pattern``, searching anywhere in the value."""
+    if value is None:
+        return None
+    return compile_pattern(pattern).search(value) is not None
+
+
+def register_functions(connection: sqlite3.Connection) -> None:
+    """Register the functions on a connection."""
+    connection.create_function("REGEXP", 2, regexp, deterministic=True)
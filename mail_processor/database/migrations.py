@@ -0,0 +1,545 @@
+"""Versioned schema migrations.
+
+The schema version is stored in SQLite's ``user_version`` header field.
+At startup every migration above it is applied in order, each one in
+its own transaction together with the version bump, so a failure leaves
+the database at the previous version.
+
+Migrations which add columns that can only be filled from GMail
+register a backfill. Backfills run from ``sync`` (the only subcommand
+which talks to GMail anyway), fill only the missing fields with batched
+metadata-only fetches, and are recorded once complete so later runs
+skip them.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Callable, Iterator, NamedTuple
+
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.errors import RateLimitedError
+from mail_processor.logger import logger
+
+if TYPE_CHECKING:
+    from mail_processor.services import GMailServices
+
+__all__ = [
+    "MIGRATIONS",
+    "apply_migrations",
+    "run_backfills",
+    "triggers_suspended",
+]
+
+# PRAGMA auto_vacuum value of incremental mode.
+INCREMENTAL = 2
+
+
+class Migration(NamedTuple):
+    """A schema migration."""
+
+    version: int
+    description: str
+    statements: list[str]
+    backfill: Callable[[GMailServices], int] | None = None
+    # Switch to incremental auto vacuum, which rewrites the database
+    # outside the migration's transaction.
+    vacuum: bool = False
+
+
+def backfill_message_metadata(service: GMailServices) -> int:
+    """Fill label_ids, internal_date and size_estimate from GMail.
+
+    Only messages missing the fields are fetched, with ``format=minimal``
+    in batches, instead of refetching the full messages.
+
+    :raises RateLimitedError: when messages are still rate limited
+        after retrying, the next sync resumes the backfill.
+    :return: the number of messages updated.
+    """
+    from mail_processor.models.message import Message
+
+    updated = 0
+    while message_ids := Message.get_ids_missing_metadata():
+        metadata, not_found = service.get_messages_metadata(message_ids)
+        Message.update_metadata(list(metadata.values()))
+        # NOTE: Messages deleted upstream can't be backfilled, clear
+        # them out of the way so the loop terminates.
+        Message.mark_metadata_unavailable(not_found)
+        updated += len(metadata)
+        logger.info(f"Backfilled metadata of {updated} messages.")
+
+        throttled = len(message_ids) - len(metadata) - len(not_found)
+        if throttled:
+            raise RateLimitedError(throttled)
+    return updated
+
+
+# Aggregates of the messages of a thread, to be filtered and grouped by
+# thread_id.
+THREAD_AGGREGATE = """
+    INSERT INTO thread
+        (thread_id, message_count, latest_date, participants)
+    SELECT
+        thread_id,
+        COUNT(*),
+        MAX(internal_date),
+        json_group_array(DISTINCT LOWER("from"))
+            FILTER (WHERE "from" IS NOT NULL)
+    FROM message
+"""
+
+
+def _participants(row: str) -> str:
+    """JSON array holding the sender of the trigger's ``row``."""
+    return (
+        f'CASE WHEN {row}."from" IS NULL THEN json_array() '
+        f'ELSE json_array(LOWER({row}."from")) END'
+    )
+
+
+def _recompute_thread(row: str) -> str:
+    """Trigger statements rebuilding the thread of ``row``."""
+    return f"""
+        DELETE FROM thread WHERE thread_id = {row}.thread_id;
+        {THREAD_AGGREGATE}
+        WHERE thread_id = {row}.thread_id
+        GROUP BY thread_id;
+    """
+
+
+def _is_unread(row: str) -> str:
+    """1 if the message of ``row`` has the UNREAD label, else 0."""
+    return f"""(instr(COALESCE({row}.label_ids, ''), '"UNREAD"') > 0)"""
+
+
+def _seen(row: str) -> str:
+    """Internal date of ``row``, NULL when unknown."""
+    return f"CASE WHEN {row}.internal_date > 0 THEN {row}.internal_date END"
+
+
+def _add_to_sender(row: str) -> str:
+    """Trigger statement counting ``row`` in its sender."""
+    return f"""
+        INSERT INTO sender (
+            address, domain, message_count, unread_count,
+            first_seen, last_seen
+        )
+        SELECT
+            {row}."from",
+            {row}.from_domain,
+            1,
+            {_is_unread(row)},
+            {_seen(row)},
+            {_seen(row)}
+        WHERE {row}."from" IS NOT NULL
+        ON CONFLICT (address) DO UPDATE SET
+            message_count = message_count + 1,
+            unread_count = unread_count + excluded.unread_count,
+            first_seen = COALESCE(
+                MIN(first_seen, excluded.first_seen),
+                first_seen,
+                excluded.first_seen
+            ),
+            last_seen = COALESCE(
+                MAX(last_seen, excluded.last_seen),
+                last_seen,
+                excluded.last_seen
+            );
+    """
+
+
+def _remove_from_sender(row: str) -> str:
+    """Trigger statements taking ``row`` out of its sender.
+
+    First and last seen are sought on the message_from index.
+    """
+    return f"""
+        UPDATE sender SET
+            message_count = message_count - 1,
+            unread_count = unread_count - {_is_unread(row)},
+            first_seen = (
+                SELECT MIN(internal_date) FROM message
+                WHERE "from" = {row}."from" AND internal_date > 0
+            ),
+            last_seen = (
+                SELECT MAX(internal_date) FROM message
+                WHERE "from" = {row}."from" AND internal_date > 0
+            )
+        WHERE address = {row}."from";
+        DELETE FROM sender
+        WHERE address = {row}."from" AND message_count <= 0;
+    """
+
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description="Initial schema",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS message_info (
+                message_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS message (
+                message_id TEXT PRIMARY KEY,
+                thread_id TEXT,
+                "from" TEXT,
+                "to" TEXT,
+                subject TEXT,
+                date TEXT,
+                body TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS label (
+                label_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                type TEXT,
+                synced_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS schema_backfill (
+                version INTEGER PRIMARY KEY,
+                completed_at TEXT NOT NULL
+            )
+            """,
+        ],
+    ),
+    Migration(
+        version=2,
+        description="Message labels, internal date and size",
+        statements=[
+            # NOTE: label_ids is a JSON array of label ids.
+            "ALTER TABLE message ADD COLUMN label_ids TEXT",
+            # NOTE: Milliseconds since epoch, -1 when GMail no longer has
+            # the message and it can't be backfilled.
+            "ALTER TABLE message ADD COLUMN internal_date INTEGER",
+            "ALTER TABLE message ADD COLUMN size_estimate INTEGER",
+        ],
+        backfill=backfill_message_metadata,
+    ),
+    Migration(
+        version=3,
+        description="Thread aggregates",
+        statements=[
+            # NOTE: latest_date is the newest internal_date of the thread,
+            # participants a JSON array of the distinct senders.
+            """
+            CREATE TABLE IF NOT EXISTS thread (
+                thread_id TEXT PRIMARY KEY,
+                message_count INTEGER NOT NULL,
+                latest_date INTEGER,
+                participants TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS message_thread_id "
+            "ON message (thread_id)",
+            # NOTE: An insert only grows its thread, so it's folded into
+            # the aggregate without reading the other messages.
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_thread_insert
+            AFTER INSERT ON message
+            WHEN NEW.thread_id IS NOT NULL
+            BEGIN
+                INSERT INTO thread
+                    (thread_id, message_count, latest_date, participants)
+                VALUES (
+                    NEW.thread_id,
+                    1,
+                    NEW.internal_date,
+                    {_participants("NEW")}
+                )
+                ON CONFLICT (thread_id) DO UPDATE SET
+                    message_count = message_count + 1,
+                    latest_date = COALESCE(
+                        MAX(latest_date, excluded.latest_date),
+                        latest_date,
+                        excluded.latest_date
+                    ),
+                    participants = CASE
+                        WHEN NEW."from" IS NULL OR EXISTS (
+                            SELECT 1 FROM json_each(thread.participants)
+                            WHERE value = LOWER(NEW."from")
+                        ) THEN participants
+                        ELSE json_insert(
+                            participants, '$[#]', LOWER(NEW."from")
+                        )
+                    END;
+            END
+            """,
+            # NOTE: Deletes and updates may remove the newest message or
+            # the last one of a sender, those threads are recomputed with
+            # the thread_id index.
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_thread_delete
+            AFTER DELETE ON message
+            WHEN OLD.thread_id IS NOT NULL
+            BEGIN
+                {_recompute_thread("OLD")}
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_thread_update
+            AFTER UPDATE OF thread_id, "from", internal_date ON message
+            BEGIN
+                {_recompute_thread("OLD")}
+                {_recompute_thread("NEW")}
+            END
+            """,
+            f"{THREAD_AGGREGATE} WHERE thread_id IS NOT NULL "
+            "GROUP BY thread_id",
+        ],
+    ),
+    Migration(
+        version=4,
+        description="Message statistics and date index",
+        statements=[
+            # NOTE: stats is a JSON object, see models/statistics.py.
+            """
+            CREATE TABLE IF NOT EXISTS statistics (
+                table_name TEXT PRIMARY KEY,
+                stats TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS message_date ON message (date)",
+        ],
+    ),
+    Migration(
+        version=5,
+        description="Sender domain",
+        statements=[
+            # NOTE: Virtual, computed from "from" on every read and
+            # stored only in the index, nothing to backfill.
+            """
+            ALTER TABLE message ADD COLUMN from_domain TEXT
+            GENERATED ALWAYS AS (
+                CASE WHEN instr("from", '@')
+                THEN LOWER(substr("from", instr("from", '@') + 1))
+                END
+            ) VIRTUAL
+            """,
+            "CREATE INDEX IF NOT EXISTS message_from_domain "
+            "ON message (from_domain)",
+        ],
+    ),
+    Migration(
+        version=6,
+        description="Sender aggregates",
+        statements=[
+            # NOTE: Addresses are stored lower cased from now on.
+            """
+            UPDATE message SET "from" = LOWER(TRIM("from"))
+            WHERE "from" != LOWER(TRIM("from"))
+            """,
+            # NOTE: first_seen and last_seen are internal dates.
+            """
+            CREATE TABLE IF NOT EXISTS sender (
+                address TEXT PRIMARY KEY,
+                domain TEXT,
+                message_count INTEGER NOT NULL,
+                unread_count INTEGER NOT NULL,
+                first_seen INTEGER,
+                last_seen INTEGER
+            )
+            """,
+            # NOTE: Serves sender lookups, and the first / last seen of a
+            # sender as a single index seek.
+            "CREATE INDEX IF NOT EXISTS message_from "
+            'ON message ("from", internal_date)',
+            "CREATE INDEX IF NOT EXISTS sender_domain ON sender (domain)",
+            f"""
+            INSERT INTO sender (
+                address, domain, message_count, unread_count,
+                first_seen, last_seen
+            )
+            SELECT
+                "from",
+                from_domain,
+                COUNT(*),
+                SUM({_is_unread("message")}),
+                MIN({_seen("message")}),
+                MAX({_seen("message")})
+            FROM message
+            WHERE "from" IS NOT NULL
+            GROUP BY "from"
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_sender_insert
+            AFTER INSERT ON message
+            WHEN NEW."from" IS NOT NULL
+            BEGIN
+                {_add_to_sender("NEW")}
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_sender_delete
+            AFTER DELETE ON message
+            WHEN OLD."from" IS NOT NULL
+            BEGIN
+                {_remove_from_sender("OLD")}
+            END
+            """,
+            # NOTE: An update is the removal of the old row and the
+            # addition of the new one.
+            f"""
+            CREATE TRIGGER IF NOT EXISTS message_sender_update
+            AFTER UPDATE OF "from", label_ids, internal_date ON message
+            BEGIN
+                {_remove_from_sender("OLD")}
+                {_add_to_sender("NEW")}
+            END
+            """,
+        ],
+    ),
+    Migration(
+        version=7,
+        description="Retention",
+        statements=[
+            # NOTE: Start of the last sync which listed the message, the
+            # ones not listed by a complete sync were deleted upstream.
+            "ALTER TABLE message_info ADD COLUMN seen_at INTEGER",
+            # NOTE: Set when the message was evicted to cap the database
+            # size, so that sync doesn't fetch it again.
+            "ALTER TABLE message_info ADD COLUMN evicted_at INTEGER",
+            # NOTE: Finds the oldest bodies left without rescanning the
+            # ones already dropped.
+            "CREATE INDEX IF NOT EXISTS message_date_body "
+            "ON message (date) WHERE body IS NOT NULL",
+        ],
+        vacuum=True,
+    ),
+    Migration(
+        version=8,
+        description="Index of the messages missing metadata",
+        statements=[
+            # NOTE: Only holds the messages left to backfill, each batch
+            # of the backfill reads it instead of scanning the table.
+            "CREATE INDEX IF NOT EXISTS message_missing_metadata "
+            "ON message (message_id) WHERE internal_date IS NULL",
+        ],
+    ),
+    Migration(
+        version=9,
+        description="Retention by received time",
+        statements=[
+            # NOTE: The oldest messages are the ones received first, the
+            # Date header is set by the sender and compares as text.
+            "DROP INDEX IF EXISTS message_date_body",
+            (
+                "CREATE INDEX IF NOT EXISTS message_internal_date_body "
+                "ON message (internal_date) WHERE body IS NOT NULL"
+            ),
+            # NOTE: Also finds the messages missing metadata, it replaces
+            # their partial index.
+            (
+                "CREATE INDEX IF NOT EXISTS message_internal_date "
+                "ON message (internal_date)"
+            ),
+            "DROP INDEX IF EXISTS message_missing_metadata",
+        ],
+    ),
+]
+
+
+@contextmanager
+def triggers_suspended(
+    conn: sqlite3.Connection,
+    table_name: str,
+) -> Iterator[None]:
+    """Drop the triggers of a table, and create them again on exit.
+
+    Only for rewrites which leave the aggregates maintained by the
+    triggers as they were. Runs in the caller's transaction, other
+    connections never see the table without its triggers, and a failure
+    rolls the drop back with the rest.
+    """
+    # NOTE: sqlite3 doesn't open a transaction for DDL on its own.
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'trigger' AND tbl_name = ?",
+        (table_name,),
+    ).fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER "{name}"')
+    yield
+    for _, sql in triggers:
+        conn.execute(sql)
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Current schema version."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> None:
+    """Switch the database to incremental auto vacuum.
+
+    Rebuilds the whole database once, it can't run in a transaction.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+        return
+    logger.info("Rebuilding the database for incremental vacuum.")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def apply_migrations() -> int:
+    """Apply the pending migrations.
+
+    :return: the schema version after migrating.
+    """
+    with sqlite_connection.writer() as conn:
+        version = get_version(conn)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            logger.info(
+                f"Migrating database to version {migration.version}: "
+                f"{migration.description}",
+            )
+            # NOTE: sqlite3 doesn't open a transaction for DDL on its own.
+            conn.execute("BEGIN")
+            try:
+                for statement in migration.statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {migration.version}")
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            version = migration.version
+            if migration.vacuum:
+                enable_incremental_vacuum(conn)
+
+    return version
+
+
+def run_backfills(service: GMailServices) -> None:
+    """Run the backfills which haven't completed yet."""
+    conn = sqlite_connection.reader()
+    completed = {
+        row[0]
+        for row in conn.execute("SELECT version FROM schema_backfill")
+    }
+    for migration in MIGRATIONS:
+        if migration.backfill is None or migration.version in completed:
+            continue
+
+        migration.backfill(service)
+        with sqlite_connection.writer() as conn:
+            conn.execute(
+                "INSERT INTO schema_backfill (version, completed_at) "
+                "VALUES (?, ?)",
+                (migration.version, datetime.now(UTC).isoformat()),
+            )
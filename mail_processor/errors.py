@@ -21,3 +21,21 @@ class UnInitializedError(Exception):
         """Initialize with default message."""
         message = "Instance not initialized."
         super().__init__(message, *args)
+
+
+class RateLimitedError(Exception):
+    """Rate Limited Error."""
+
+    def __init__(self, count: int, *args: tuple[Any, ...]) -> None:
+        """Initialize with default message."""
+        message = f"{count} requests still rate limited after retrying."
+        super().__init__(message, *args)
+
+
+class UnknownLabelError(Exception):
+    """Unknown Label Error."""
+
+    def __init__(self, label: str, *args: tuple[Any, ...]) -> None:
+        """Initialize with default message."""
+        message = f"No label found with name or id: {label!r}."
+        super().__init__(message, *args)
@@ -0,0 +1,101 @@
+"""Local cache of GMail labels with name to ID resolution."""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+from mail_processor.config import app_config
+from mail_processor.errors import UnknownLabelError
+from mail_processor.logger import logger
+from mail_processor.models.label import Label
+
+__all__ = ["LabelResolver", "get_labels", "refresh_labels"]
+
+
+def refresh_labels() -> list[Label]:
+    """Fetch the labels from GMail and replace the cache."""
+    from mail_processor.services import GMailServices
+
+    synced_at = datetime.now(UTC).isoformat()
+    labels = [
+        Label(
+            label_id=label["id"],
+            name=label["name"],
+            type_=label.get("type", "user"),
+            synced_at=synced_at,
+        )
+        for label in GMailServices().get_labels().get("labels", [])
+    ]
+    Label.replace_all(labels)
+    logger.debug(f"Refreshed {len(labels)} labels.")
+    return sorted(labels, key=lambda label: label.name)
+
+
+def is_stale() -> bool:
+    """Check whether the cache is empty or older than the TTL."""
+    synced_at = Label.get_synced_at()
+    if synced_at is None:
+        return True
+    age = datetime.now(UTC) - datetime.fromisoformat(synced_at)
+    return age > timedelta(seconds=app_config.LABEL_CACHE_TTL)
+
+
+def get_labels(*, refresh: bool = False) -> list[Label]:
+    """Get the labels, from the cache while it is fresh."""
+    if refresh or is_stale():
+        return refresh_labels()
+    return Label.get_all()
+
+
+class LabelResolver:
+    """Resolve label names or IDs to label IDs using the cache."""
+
+    def __init__(self, *, offline: bool = False) -> None:
+        """Initialize, the cache is read on the first lookup.
+
+        :param offline: Only use the local cache, never refresh it from
+            GMail.
+        """
+        self.offline = offline
+        self._loaded = False
+        self._refreshed = False
+
+    def _load(self, labels: list[Label]) -> None:
+        """Build the lookup maps."""
+        self.ids = {label.label_id for label in labels}
+        self.by_name = {label.name: label.label_id for label in labels}
+        self.by_lower_name = {
+            label.name.lower(): label.label_id for label in labels
+        }
+
+    def _lookup(self, value: str) -> str | None:
+        """Look a label up by ID, then name, then case-insensitive name."""
+        if not self._loaded:
+            self._refreshed = not self.offline and is_stale()
+            self._load(
+                refresh_labels() if self._refreshed else Label.get_all(),
+            )
+            self._loaded = True
+        if value in self.ids:
+            return value
+        return self.by_name.get(value) or self.by_lower_name.get(
+            value.lower(),
+        )
+
+    def resolve(self, value: str) -> str:
+        """Resolve a label name or ID to its ID.
+
+        The cache is refreshed once on a miss, a label could have been
+        created since the last refresh.
+
+        :raises UnknownLabelError: If no such label exists.
+        :return: the label id
+        """
+        label_id = self._lookup(value)
+        if label_id is None and not (self._refreshed or self.offline):
+            self._refreshed = True
+            self._load(refresh_labels())
+            label_id = self._lookup(value)
+        if label_id is None:
+            raise UnknownLabelError(value)
+        return label_id
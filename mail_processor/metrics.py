@@ -0,0 +1,293 @@
+"""Run metrics: API calls, SQL statements, phases and rules.
+
+Everything is recorded into the process wide ``metrics`` registry and
+emitted once at the end of a run, either as a JSON summary or as a
+Prometheus textfile for the node exporter's textfile collector.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+__all__ = ["Histogram", "Metrics", "metrics", "statement_name"]
+
+# Upper bounds in seconds, shared by API and SQL latencies.
+BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_table_regex = re.compile(
+    r"\b(?:FROM|INTO|UPDATE(?!\s+OF\b)|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)"
+    r"\s+\"?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def statement_name(sql: str) -> str:
+    """Group SQL statements by verb and table, e.g. ``SELECT message``."""
+    words = sql.split(maxsplit=2)
+    if not words:
+        return "EMPTY"
+    verb = words[0].upper()
+    if verb == "PRAGMA" and len(words) > 1:
+        return f"PRAGMA {words[1].split('(')[0].split('=')[0]}"
+    match = _table_regex.search(sql)
+    return f"{verb} {match.group(1)}" if match else verb
+
+
+class Histogram:
+    """Cumulative latency histogram, in the Prometheus style."""
+
+    def __init__(self) -> None:
+        """Initialize empty buckets."""
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        """Record an observation."""
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, data: dict) -> None:
+        """Add the observations of a serialized histogram."""
+        for i, count in enumerate(data["counts"]):
+            self.counts[i] += count
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+    def to_dict(self) -> dict:
+        """Serialize."""
+        return {
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """``(le, count)`` pairs including the ``+Inf`` bucket."""
+        total = 0
+        pairs = []
+        for bound, count in zip((*BUCKETS, "+Inf"), self.counts):
+            total += count
+            pairs.append((str(bound), total))
+        return pairs
+
+
+class Metrics:
+    """Thread safe registry of the run metrics."""
+
+    def __init__(self) -> None:
+        """Initialize an empty registry."""
+        self._lock = threading.Lock()
+        self.api_calls: Counter[str] = Counter()
+        self.api_errors: Counter[str] = Counter()
+        self.quota_units: Counter[str] = Counter()
+        self.api_latency: defaultdict[str, Histogram] = defaultdict(
+            Histogram,
+        )
+        self.sql_latency: defaultdict[str, Histogram] = defaultdict(
+            Histogram,
+        )
+        self.phases: Counter[str] = Counter()
+        self.rules: defaultdict[str, Counter[str]] = defaultdict(Counter)
+
+    def record_api_call(
+        self,
+        method: str,
+        seconds: float,
+        units: int,
+        *,
+        error: bool = False,
+    ) -> None:
+        """Record a GMail API call."""
+        with self._lock:
+            self.api_calls[method] += 1
+            self.quota_units[method] += units
+            self.api_latency[method].observe(seconds)
+            if error:
+                self.api_errors[method] += 1
+
+    def record_sql(self, name: str, seconds: float) -> None:
+        """Record the time spent on a SQL statement."""
+        with self._lock:
+            self.sql_latency[name].observe(seconds)
+
+    def record_rule(self, rule: str, *, matches: int, actions: int) -> None:
+        """Record the matches and actions of a rule."""
+        with self._lock:
+            self.rules[rule]["matches"] += matches
+            self.rules[rule]["actions"] += actions
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase of the run, nested phases are counted in both."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] += elapsed
+
+    def snapshot(self) -> dict:
+        """Serializable copy of the metrics."""
+        with self._lock:
+            return {
+                "api": {
+                    method: {
+                        "calls": self.api_calls[method],
+                        "errors": self.api_errors[method],
+                        "quota_units": self.quota_units[method],
+                        "latency": self.api_latency[method].to_dict(),
+                    }
+                    for method in sorted(self.api_calls)
+                },
+                "sql": {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self.sql_latency.items())
+                },
+                "phases": dict(sorted(self.phases.items())),
+                "rules": {
+                    rule: dict(counts)
+                    for rule, counts in self.rules.items()
+                },
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """Add the metrics of a snapshot, e.g. from another process."""
+        with self._lock:
+            for method, api in snapshot["api"].items():
+                self.api_calls[method] += api["calls"]
+                self.api_errors[method] += api["errors"]
+                self.quota_units[method] += api["quota_units"]
+                self.api_latency[method].merge(api["latency"])
+            for name, histogram in snapshot["sql"].items():
+                self.sql_latency[name].merge(histogram)
+            self.phases.update(snapshot["phases"])
+            for rule, counts in snapshot["rules"].items():
+                self.rules[rule].update(counts)
+
+    def to_json(self) -> str:
+        """JSON summary."""
+        summary = self.snapshot()
+        summary["totals"] = {
+            "api_calls": sum(self.api_calls.values()),
+            "api_errors": sum(self.api_errors.values()),
+            "quota_units": sum(self.quota_units.values()),
+            "sql_seconds": sum(
+                histogram.sum for histogram in self.sql_latency.values()
+            ),
+        }
+        return json.dumps(summary, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_: str) -> None:
+            lines.append(f"# HELP mail_processor_{name} {help_}")
+            lines.append(f"# TYPE mail_processor_{name} {kind}")
+
+        def sample(name: str, labels: dict, value: float) -> None:
+            label_str = ",".join(
+                f'{key}="{_escape(str(val))}"' for key, val in labels.items()
+            )
+            lines.append(f"mail_processor_{name}{{{label_str}}} {value}")
+
+        def histogram(name: str, label: str, items: dict) -> None:
+            for key, hist in items.items():
+                for le, count in hist.cumulative():
+                    sample(f"{name}_bucket", {label: key, "le": le}, count)
+                sample(f"{name}_sum", {label: key}, hist.sum)
+                sample(f"{name}_count", {label: key}, hist.count)
+
+        with self._lock:
+            family("api_calls_total", "counter", "GMail API calls.")
+            for method, count in sorted(self.api_calls.items()):
+                sample("api_calls_total", {"method": method}, count)
+            family("api_errors_total", "counter", "Failed GMail API calls.")
+            for method, count in sorted(self.api_errors.items()):
+                sample("api_errors_total", {"method": method}, count)
+            family("quota_units_total", "counter", "GMail quota units used.")
+            for method, units in sorted(self.quota_units.items()):
+                sample("quota_units_total", {"method": method}, units)
+            family(
+                "api_latency_seconds",
+                "histogram",
+                "GMail API call latency.",
+            )
+            histogram("api_latency_seconds", "method", self.api_latency)
+            family("sql_seconds", "histogram", "SQLite statement time.")
+            histogram("sql_seconds", "statement", self.sql_latency)
+            family("phase_seconds", "gauge", "Time spent per phase.")
+            for phase, seconds in sorted(self.phases.items()):
+                sample("phase_seconds", {"phase": phase}, seconds)
+            family("rule_matches", "gauge", "Messages matched per rule.")
+            for rule, counts in self.rules.items():
+                sample("rule_matches", {"rule": rule}, counts["matches"])
+            family("rule_actions", "gauge", "API actions issued per rule.")
+            for rule, counts in self.rules.items():
+                sample("rule_actions", {"rule": rule}, counts["actions"])
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_format: str, path: str | None) -> None:
+        """Write the metrics, to stderr when no path is given.
+
+        stdout is left to the subcommand's own output, e.g. the report
+        of ``senders --json``. Files are replaced atomically so that the
+        node exporter never reads a partially written textfile.
+        """
+        content = (
+            self.to_prometheus()
+            if output_format == "prometheus"
+            else self.to_json()
+        )
+        if path is None:
+            print(content, file=sys.stderr)  # noqa: T201
+            return
+
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=target.parent,
+            prefix=f".{target.name}.",
+        )
+        with os.fdopen(fd, "w") as fp:
+            fp.write(content)
+        Path(tmp_path).chmod(0o644)
+        os.replace(tmp_path, target)
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+metrics = Metrics()
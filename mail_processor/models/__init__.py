@@ -1,11 +1,24 @@
 """Module entry for models."""
 
+from mail_processor.database.migrations import apply_migrations
+from mail_processor.models.label import Label
 from mail_processor.models.message import Message
 from mail_processor.models.message_info import MessageInfo
+from mail_processor.models.sender import Sender
+from mail_processor.models.statistics import Statistics
+from mail_processor.models.thread import Thread
+
+__all__ = [
+    "Label",
+    "Message",
+    "MessageInfo",
+    "Sender",
+    "Statistics",
+    "Thread",
+    "initialize_models",
+]
 
 
 def initialize_models() -> None:
-    """Initialize Models in DB."""
-    models = [MessageInfo, Message]
-    for model in models:
-        model.create_table()
+    """Initialize Models in DB, migrating the schema to the latest."""
+    apply_migrations()
@@ -0,0 +1,69 @@
+"""Label Model."""
+
+from __future__ import annotations
+
+from mail_processor.database.connection import sqlite_connection
+
+
+class Label:
+    """Model for label table."""
+
+    table_name = "label"
+
+    def __init__(
+        self,
+        label_id: str,
+        name: str,
+        type_: str,
+        synced_at: str,
+    ) -> None:
+        """Initialize Label attribute."""
+        self.label_id = label_id
+        self.name = name
+        self.type_ = type_
+        self.synced_at = synced_at
+
+    @staticmethod
+    def replace_all(labels: list[Label]) -> None:
+        """Replace the cached labels in a single transaction."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM {Label.table_name}")
+            cursor.executemany(
+                f"""
+                    INSERT INTO {Label.table_name}
+                        (label_id, name, type, synced_at)
+                    VALUES (?, ?, ?, ?)
+                """,
+                [
+                    (label.label_id, label.name, label.type_, label.synced_at)
+                    for label in labels
+                ],
+            )
+
+    @staticmethod
+    def get_all() -> list[Label]:
+        """Get All Label's."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT label_id, name, type, synced_at "
+            f"FROM {Label.table_name} ORDER BY name",
+        )
+        return [
+            Label(
+                label_id=label[0],
+                name=label[1],
+                type_=label[2],
+                synced_at=label[3],
+            )
+            for label in cursor.fetchall()
+        ]
+
+    @staticmethod
+    def get_synced_at() -> str | None:
+        """Get the time the cache was last refreshed."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MIN(synced_at) FROM {Label.table_name}")
+        return cursor.fetchone()[0]
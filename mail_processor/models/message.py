@@ -1,10 +1,23 @@
-"""Message Info Model."""
+"""Message Model."""
 
 from __future__ import annotations
 
+import json
+
 from mail_processor.database.connection import sqlite_connection
+from mail_processor.database.migrations import triggers_suspended
+from mail_processor.models.message_info import MessageInfo
 
-conn = sqlite_connection.get_connection()
+# Columns in the order of Message's constructor, shared by every query.
+COLUMNS = (
+    'message_id, thread_id, "from", "to", subject, date, body, '
+    "label_ids, internal_date, size_estimate"
+)
+# Like ``COLUMNS``, with a NULL body.
+HEADER_COLUMNS = (
+    'message_id, thread_id, "from", "to", subject, date, NULL, '
+    "label_ids, internal_date, size_estimate"
+)
 
 
 class Message:
@@ -21,8 +34,11 @@ class Message:
         subject: str,
         date: str,
         body: str,
+        label_ids: list[str] | None = None,
+        internal_date: int | None = None,
+        size_estimate: int | None = None,
     ) -> None:
-        """Initialize Message Info attribute."""
+        """Initialize Message attribute."""
         self.message_id = message_id
         self.thread_id = thread_id
         self.from_ = from_
@@ -30,151 +46,328 @@ class Message:
         self.subject = subject
         self.date = date
         self.body = body
+        self.label_ids = label_ids
+        self.internal_date = internal_date
+        self.size_estimate = size_estimate
 
     @staticmethod
-    def create_table() -> None:
-        """Create table."""
-        cursor = conn.cursor()
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {Message.table_name} (
-                message_id TEXT PRIMARY KEY,
-                thread_id TEXT,
-                "from" TEXT,
-                "to" TEXT,
-                subject TEXT,
-                date TEXT,
-                body TEXT
-            )
-        """)
-        conn.commit()
+    def from_row(row: tuple) -> Message:
+        """Build a Message from a row selected with ``COLUMNS``."""
+        return Message(
+            message_id=row[0],
+            thread_id=row[1],
+            from_=row[2],
+            to=row[3],
+            subject=row[4],
+            date=row[5],
+            body=row[6],
+            label_ids=json.loads(row[7]) if row[7] is not None else None,
+            internal_date=row[8],
+            size_estimate=row[9],
+        )
+
+    def to_row(self) -> tuple:
+        """Values in the order of ``COLUMNS``."""
+        return (
+            self.message_id,
+            self.thread_id,
+            self.from_,
+            self.to,
+            self.subject,
+            self.date,
+            self.body,
+            json.dumps(self.label_ids) if self.label_ids is not None else None,
+            self.internal_date,
+            self.size_estimate,
+        )
 
     @staticmethod
     def bulk_insert(messages: list[Message]) -> None:
         """Store multiple message."""
-        cursor = conn.cursor()
-        message_info_values = [
-            (
-                message.message_id,
-                message.thread_id,
-                message.from_,
-                message.to,
-                message.subject,
-                message.date,
-                message.body,
+        message_values = [message.to_row() for message in messages]
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    INSERT OR IGNORE INTO {Message.table_name} ({COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                message_values,
             )
-            for message in messages
-        ]
-        cursor.executemany(
-            f"""
-                INSERT OR IGNORE INTO {Message.table_name}
-                    (message_id, thread_id, "from", "to", subject, date, body)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            message_info_values,
-        )
-        conn.commit()
 
     def save(self) -> None:
         """Save the entry."""
+        Message.bulk_insert([self])
+
+    @staticmethod
+    def get_all() -> list[Message]:
+        """Get All Message's."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
+        cursor.execute(f"SELECT {COLUMNS} FROM {Message.table_name}")
+        return [Message.from_row(message) for message in cursor.fetchall()]
+
+    @staticmethod
+    def get_missing_ids(message_ids: list[str]) -> list[str]:
+        """Get the ids, out of the given ones, not stored yet.
+
+        Messages evicted to cap the database size are not missing.
+        """
+        if not message_ids:
+            return []
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in message_ids)
         cursor.execute(
             f"""
-            INSERT OR IGNORE INTO {Message.table_name}
-                    (message_id, thread_id, "from", "to", subject, date, body)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                SELECT message_id FROM {Message.table_name}
+                WHERE message_id IN ({placeholders})
+                UNION ALL
+                SELECT message_id FROM {MessageInfo.table_name}
+                WHERE evicted_at IS NOT NULL
+                    AND message_id IN ({placeholders})
             """,
-            (
-                self.message_id,
-                self.thread_id,
-                self.from_,
-                self.to,
-                self.subject,
-                self.date,
-                self.body,
-            ),
+            message_ids + message_ids,
         )
-        conn.commit()
+        existing = {row[0] for row in cursor.fetchall()}
+        return [
+            message_id
+            for message_id in message_ids
+            if message_id not in existing
+        ]
 
     @staticmethod
-    def get_all() -> list[Message]:
-        """Get All Message's."""
+    def get_ids_missing_metadata(limit: int = 500) -> list[str]:
+        """Get ids of messages synced before the metadata columns."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT "
-            'message_id, thread_id, "from", "to", subject, date, body '
-            f"FROM {Message.table_name}",
+            f"""
+                SELECT message_id FROM {Message.table_name}
+                WHERE internal_date IS NULL
+                LIMIT ?
+            """,
+            (limit,),
         )
-        return [
-            Message(
-                message_id=message[0],
-                thread_id=message[1],
-                from_=message[2],
-                to=message[3],
-                subject=message[4],
-                date=message[5],
-                body=message[6],
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def update_metadata(resources: list[dict]) -> None:
+        """Fill the metadata columns from ``format=minimal`` resources."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    UPDATE {Message.table_name}
+                    SET label_ids = ?, internal_date = ?, size_estimate = ?
+                    WHERE message_id = ?
+                """,
+                [
+                    (
+                        json.dumps(resource.get("labelIds", [])),
+                        int(resource["internalDate"]),
+                        resource.get("sizeEstimate"),
+                        resource["id"],
+                    )
+                    for resource in resources
+                ],
+            )
+
+    @staticmethod
+    def modify_labels(
+        ids: list[str],
+        add_label_ids: list[str],
+        remove_label_ids: list[str],
+        *,
+        by_thread: bool = False,
+    ) -> None:
+        """Apply a label change made upstream to the stored messages.
+
+        :param ids: Message ids, or thread ids when ``by_thread``.
+        """
+        column = "thread_id" if by_thread else "message_id"
+        add = json.dumps(add_label_ids)
+        remove = json.dumps(remove_label_ids + add_label_ids)
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    UPDATE {Message.table_name}
+                    SET label_ids = (
+                        SELECT json_group_array(value) FROM (
+                            SELECT value FROM json_each(label_ids)
+                            WHERE value NOT IN (
+                                SELECT value FROM json_each(?)
+                            )
+                            UNION ALL
+                            SELECT value FROM json_each(?)
+                        )
+                    )
+                    WHERE {column} = ? AND label_ids IS NOT NULL
+                """,
+                [(remove, add, id_) for id_ in ids],
+            )
+
+    @staticmethod
+    def mark_metadata_unavailable(message_ids: list[str]) -> None:
+        """Flag messages whose metadata can't be fetched anymore."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    UPDATE {Message.table_name} SET internal_date = -1
+                    WHERE message_id = ?
+                """,
+                [(message_id,) for message_id in message_ids],
             )
-            for message in cursor.fetchall()
-        ]
 
     @staticmethod
     def get_by_message_id(message_id: str) -> Message | None:
         """Get By Message Id."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT "
-            'message_id, thread_id, "from", "to", subject, date, body '
-            f"FROM {Message.table_name} WHERE id = ?",
+            f"SELECT {COLUMNS} FROM {Message.table_name} WHERE message_id = ?",
             (message_id,),
         )
         message = cursor.fetchone()
         if message:
-            return Message(
-                message_id=message[0],
-                thread_id=message[1],
-                from_=message[2],
-                to=message[3],
-                subject=message[4],
-                date=message[5],
-                body=message[6],
-            )
+            return Message.from_row(message)
         return None
 
     @staticmethod
-    def get_by_filter(where_clause: str) -> list[Message]:
+    def get_by_filter(
+        where_clause: str,
+        params: list | tuple = (),
+    ) -> list[Message]:
+        """Get the messages matching a WHERE clause."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT "
-            'message_id, thread_id, "from", "to", subject, date, body '
-            f"FROM {Message.table_name} "
+            f"SELECT {COLUMNS} FROM {Message.table_name} "
             f"WHERE {where_clause}",
+            params,
         )
-        return [
-            Message(
-                message_id=message[0],
-                thread_id=message[1],
-                from_=message[2],
-                to=message[3],
-                subject=message[4],
-                date=message[5],
-                body=message[6],
-            )
-            for message in cursor.fetchall()
-        ]
+        return [Message.from_row(message) for message in cursor.fetchall()]
 
     @staticmethod
     def delete(message_id: str) -> None:
         """Delete message by message_id."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"DELETE FROM {Message.table_name} WHERE message_id = ?",
+                (message_id,),
+            )
+
+    @staticmethod
+    def delete_many(message_ids: list[str]) -> None:
+        """Delete messages by message_id."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"DELETE FROM {Message.table_name} WHERE message_id = ?",
+                [(message_id,) for message_id in message_ids],
+            )
+
+    @staticmethod
+    def count() -> int:
+        """Number of messages stored."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {Message.table_name}")
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def get_oldest_ids(limit: int) -> list[str]:
+        """Get ids of the oldest messages."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
-            f"DELETE FROM {Message.table_name} WHERE id = ?",
-            (message_id,),
+            f"""
+                SELECT message_id FROM {Message.table_name}
+                ORDER BY internal_date LIMIT ?
+            """,
+            (limit,),
         )
-        conn.commit()
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def get_oldest_bodies(
+        limit: int,
+        before: int | None = None,
+    ) -> list[tuple[str, int]]:
+        """Get ids and body sizes in bytes of the oldest bodies.
+
+        Messages are ordered by the time GMail received them, the ones
+        synced before it was stored come first.
+
+        :param before: Only bodies of messages received before this
+            time, in milliseconds since the epoch.
+        """
+        where_clause = "body IS NOT NULL"
+        params: list = []
+        if before is not None:
+            where_clause += " AND internal_date < ?"
+            params.append(before)
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+                SELECT message_id, LENGTH(CAST(body AS BLOB))
+                FROM {Message.table_name}
+                WHERE {where_clause}
+                ORDER BY internal_date
+                LIMIT ?
+            """,
+            [*params, limit],
+        )
+        return cursor.fetchall()
+
+    @staticmethod
+    def drop_bodies(message_ids: list[str]) -> None:
+        """Drop the bodies of messages, keeping the headers.
+
+        The rows are rewritten instead of updated: a shrunk row keeps
+        its page, while rewritten rows are appended and leave whole
+        pages free for incremental vacuum to give back.
+
+        The thread and sender aggregates don't depend on the body, the
+        triggers maintaining them are suspended for the rewrite, which
+        leaves them unchanged.
+        """
+        placeholders = ", ".join("?" for _ in message_ids)
+        with (
+            sqlite_connection.writer() as conn,
+            triggers_suspended(conn, Message.table_name),
+        ):
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                    SELECT {HEADER_COLUMNS} FROM {Message.table_name}
+                    WHERE message_id IN ({placeholders})
+                """,
+                message_ids,
+            )
+            rows = cursor.fetchall()
+            cursor.execute(
+                f"""
+                    DELETE FROM {Message.table_name}
+                    WHERE message_id IN ({placeholders})
+                """,
+                message_ids,
+            )
+            cursor.executemany(
+                f"""
+                    INSERT INTO {Message.table_name} ({COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
 
     @staticmethod
     def delete_all() -> None:
         """Delete all messages."""
-        cursor = conn.cursor()
-        cursor.execute(f"DELETE FROM {Message.table_name}")
-        conn.commit()
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM {Message.table_name}")
@@ -4,66 +4,69 @@ from __future__ import annotations
 
 from mail_processor.database.connection import sqlite_connection
 
-conn = sqlite_connection.get_connection()
-
 
 class MessageInfo:
     """Model for message_info table."""
 
     table_name = "message_info"
 
-    def __init__(self, message_id: str, thread_id: str) -> None:
-        """Initialize Message Info attribute."""
+    def __init__(
+        self,
+        message_id: str,
+        thread_id: str,
+        seen_at: int | None = None,
+    ) -> None:
+        """Initialize Message Info attribute.
+
+        :param seen_at: Start of the sync which listed the message, in
+            milliseconds since epoch.
+        """
         self.message_id = message_id
         self.thread_id = thread_id
-
-    @staticmethod
-    def create_table() -> None:
-        """Create table."""
-        cursor = conn.cursor()
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {MessageInfo.table_name} (
-                message_id TEXT PRIMARY KEY,
-                thread_id TEXT NOT NULL
-            )
-        """)
-        conn.commit()
+        self.seen_at = seen_at
 
     @staticmethod
     def bulk_insert(message_infos: list[MessageInfo]) -> None:
-        """Store multiple message_infos."""
-        cursor = conn.cursor()
+        """Store multiple message_infos, updating when they were seen."""
         message_info_values = [
-            (message_info.message_id, message_info.thread_id)
+            (
+                message_info.message_id,
+                message_info.thread_id,
+                message_info.seen_at,
+            )
             for message_info in message_infos
         ]
-        cursor.executemany(
-            f"""
-                INSERT OR IGNORE INTO {MessageInfo.table_name}
-                    (message_id, thread_id)
-                VALUES (?, ?)
-            """,
-            message_info_values,
-        )
-        conn.commit()
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    INSERT INTO {MessageInfo.table_name}
+                        (message_id, thread_id, seen_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (message_id) DO UPDATE SET
+                        seen_at = COALESCE(excluded.seen_at, seen_at)
+                """,
+                message_info_values,
+            )
 
     def save(self) -> None:
         """Save the entry."""
-        cursor = conn.cursor()
-        cursor.execute(
-            f"""
-            INSERT INTO {self.table_name}
-                (message_id, thread_id)
-            VALUES
-                (?, ?)
-            """,
-            (self.message_id, self.thread_id),
-        )
-        conn.commit()
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table_name}
+                    (message_id, thread_id)
+                VALUES
+                    (?, ?)
+                """,
+                (self.message_id, self.thread_id),
+            )
 
     @staticmethod
     def get_all() -> list[MessageInfo]:
         """Get All MessageInfo's."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
             "SELECT message_id, thread_id "
@@ -80,6 +83,7 @@ class MessageInfo:
     @staticmethod
     def get_by_message_id(message_id: str) -> MessageInfo | None:
         """Get By Message Id."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
             f"""
@@ -99,15 +103,54 @@ class MessageInfo:
     @staticmethod
     def delete(message_id: str) -> None:
         """Delete message info by message_id."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"DELETE FROM {MessageInfo.table_name} WHERE message_id = ?",
+                (message_id,),
+            )
+
+    @staticmethod
+    def delete_many(message_ids: list[str]) -> None:
+        """Delete message infos by message_id."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"DELETE FROM {MessageInfo.table_name} WHERE message_id = ?",
+                [(message_id,) for message_id in message_ids],
+            )
+
+    @staticmethod
+    def get_unseen_ids(seen_since: int, limit: int) -> list[str]:
+        """Get ids of stored messages not listed since ``seen_since``."""
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         cursor.execute(
-            f"DELETE FROM {MessageInfo.table_name} WHERE id = ?",
-            (message_id,),
+            f"""
+                SELECT message_id FROM {MessageInfo.table_name}
+                WHERE seen_at IS NULL OR seen_at < ?
+                LIMIT ?
+            """,
+            (seen_since, limit),
         )
-        conn.commit()
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def mark_evicted(message_ids: list[str], evicted_at: int) -> None:
+        """Flag messages evicted from the local database."""
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"""
+                    UPDATE {MessageInfo.table_name} SET evicted_at = ?
+                    WHERE message_id = ?
+                """,
+                [(evicted_at, message_id) for message_id in message_ids],
+            )
 
     @staticmethod
     def get_message_infos_by_ids(message_ids: list[str]):
+        conn = sqlite_connection.reader()
         cursor = conn.cursor()
         placeholders = ", ".join("?" for _ in message_ids)
         cursor.execute(
@@ -0,0 +1,93 @@
+"""Sender Model.
+
+Rows are aggregates of the message table by normalized address,
+maintained by triggers, so the model is read only.
+"""
+
+from __future__ import annotations
+
+from mail_processor.database.connection import sqlite_connection
+
+# Sort orders of the sender report.
+ORDER_BY = {
+    "messages": "message_count DESC",
+    "unread": "unread_count DESC",
+    "recent": "last_seen DESC",
+}
+
+
+class Sender:
+    """Model for sender table."""
+
+    table_name = "sender"
+
+    def __init__(  # noqa: PLR0913
+        self,
+        address: str,
+        domain: str | None,
+        message_count: int,
+        unread_count: int,
+        first_seen: int | None,
+        last_seen: int | None,
+    ) -> None:
+        """Initialize Sender attribute."""
+        self.address = address
+        self.domain = domain
+        self.message_count = message_count
+        self.unread_count = unread_count
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+
+    @staticmethod
+    def get_top(
+        limit: int,
+        order_by: str = "messages",
+        *,
+        by_domain: bool = False,
+    ) -> list[Sender]:
+        """Get the top senders, or domains as a sender each."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        if by_domain:
+            cursor.execute(
+                f"""
+                    SELECT
+                        domain,
+                        domain,
+                        SUM(message_count) AS message_count,
+                        SUM(unread_count) AS unread_count,
+                        MIN(first_seen),
+                        MAX(last_seen) AS last_seen
+                    FROM {Sender.table_name}
+                    WHERE domain IS NOT NULL
+                    GROUP BY domain
+                    ORDER BY {ORDER_BY[order_by]}
+                    LIMIT ?
+                """,
+                (limit,),
+            )
+        else:
+            cursor.execute(
+                f"""
+                    SELECT
+                        address, domain, message_count, unread_count,
+                        first_seen, last_seen
+                    FROM {Sender.table_name}
+                    ORDER BY {ORDER_BY[order_by]}
+                    LIMIT ?
+                """,
+                (limit,),
+            )
+        return [Sender(*sender) for sender in cursor.fetchall()]
+
+    @staticmethod
+    def count_messages(where_clause: str, params: list | tuple = ()) -> int:
+        """Messages of the senders matching a WHERE clause."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COALESCE(SUM(message_count), 0) "
+            f"FROM {Sender.table_name} WHERE {where_clause}",
+            params,
+        )
+        return cursor.fetchone()[0]
@@ -0,0 +1,191 @@
+"""Statistics Model."""
+
+from __future__ import annotations
+
+import json
+from collections import Counter
+from datetime import UTC, datetime
+
+from mail_processor.database.connection import sqlite_connection
+
+# Text columns of message with statistics, by rule field name.
+TEXT_COLUMNS = {
+    "From": '"from"',
+    "To": '"to"',
+    "Subject": "subject",
+    "Body": "body",
+    "From Domain": "from_domain",
+}
+
+# NOTE: ANALYZE only samples this many rows per index.
+ANALYSIS_LIMIT = 1000
+
+# Sender domains with their message counts kept.
+TOP_DOMAINS = 1000
+
+# Rows sampled for the distinct counts and average lengths, a full scan
+# would lower case and sort every body.
+SAMPLE_SIZE = 1000
+
+# Fraction of the rows added or removed since the last refresh above
+# which the statistics are stale.
+STALE_FRACTION = 0.1
+
+
+def estimate_distinct(values: list[str], sampled: int, total: int) -> int:
+    """Estimate the distinct values of a column from a sample of it.
+
+    Uses the bias corrected Chao1 estimator, the values seen once or
+    twice in the sample tell how many were never seen.
+
+    :param sampled: Rows sampled, NULLs included.
+    :param total: Rows in the table.
+    """
+    counts = Counter(values)
+    if sampled >= total:
+        return len(counts)
+    once = sum(1 for count in counts.values() if count == 1)
+    twice = sum(1 for count in counts.values() if count == 2)  # noqa: PLR2004
+    estimate = len(counts) + once * (once - 1) / (2 * (twice + 1))
+    return min(total, round(estimate))
+
+
+class Statistics:
+    """Model for statistics table, summaries of the message table."""
+
+    table_name = "statistics"
+
+    def __init__(
+        self,
+        row_count: int,
+        distinct: dict[str, int],
+        avg_length: dict[str, float],
+        date_histogram: dict[str, int],
+        updated_at: str,
+        domain_counts: dict[str, int] | None = None,
+    ) -> None:
+        """Initialize Statistics attribute.
+
+        :param distinct: Distinct lower cased values by field name.
+        :param avg_length: Average length of the values by field name.
+        :param date_histogram: Messages by day, ``YYYY-MM-DD``.
+        :param domain_counts: Messages of the ``TOP_DOMAINS`` most
+            frequent sender domains.
+        """
+        self.row_count = row_count
+        self.distinct = distinct
+        self.avg_length = avg_length
+        self.date_histogram = date_histogram
+        self.domain_counts = domain_counts or {}
+        self.updated_at = updated_at
+
+    def to_json(self) -> str:
+        """Serialize the statistics."""
+        return json.dumps(
+            {
+                "row_count": self.row_count,
+                "distinct": self.distinct,
+                "avg_length": self.avg_length,
+                "date_histogram": self.date_histogram,
+                "domain_counts": self.domain_counts,
+            },
+        )
+
+    @staticmethod
+    def refresh() -> Statistics:
+        """Recompute the statistics of the message table.
+
+        Distinct counts and average lengths are estimated from a random
+        sample of ``SAMPLE_SIZE`` rows. SQLite's own ``sqlite_stat1`` is
+        refreshed too, so its planner picks between the indexes with
+        current row counts.
+        """
+        with sqlite_connection.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM message")
+            row_count = cursor.fetchone()[0]
+            # NOTE: Only the rowids are shuffled, the rows are read for
+            # the sample alone.
+            cursor.execute(
+                f"SELECT {', '.join(TEXT_COLUMNS.values())} FROM message "
+                "WHERE rowid IN "
+                "(SELECT rowid FROM message ORDER BY random() LIMIT ?)",
+                (SAMPLE_SIZE,),
+            )
+            sample = cursor.fetchall()
+            columns = {
+                field: [row[i] for row in sample if row[i] is not None]
+                for i, field in enumerate(TEXT_COLUMNS)
+            }
+            cursor.execute(
+                "SELECT substr(date, 1, 10), COUNT(*) FROM message "
+                "WHERE date IS NOT NULL GROUP BY 1",
+            )
+            date_histogram = dict(cursor.fetchall())
+            cursor.execute(
+                "SELECT from_domain, COUNT(*) FROM message "
+                "WHERE from_domain IS NOT NULL "
+                "GROUP BY 1 ORDER BY 2 DESC LIMIT ?",
+                (TOP_DOMAINS,),
+            )
+            statistics = Statistics(
+                row_count=row_count,
+                distinct={
+                    field: estimate_distinct(
+                        [value.lower() for value in values],
+                        len(sample),
+                        row_count,
+                    )
+                    for field, values in columns.items()
+                },
+                avg_length={
+                    field: (
+                        sum(map(len, values)) / len(values) if values else 0
+                    )
+                    for field, values in columns.items()
+                },
+                date_histogram=date_histogram,
+                domain_counts=dict(cursor.fetchall()),
+                updated_at=datetime.now(UTC).isoformat(),
+            )
+            cursor.execute(
+                f"""
+                    INSERT OR REPLACE INTO {Statistics.table_name}
+                        (table_name, stats, updated_at)
+                    VALUES ('message', ?, ?)
+                """,
+                (statistics.to_json(), statistics.updated_at),
+            )
+            cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            cursor.execute("ANALYZE message")
+        return statistics
+
+    @staticmethod
+    def is_stale() -> bool:
+        """Whether the statistics are missing or the row count drifted.
+
+        Counting the rows only walks the smallest index, unlike a
+        refresh.
+        """
+        statistics = Statistics.get()
+        if statistics is None:
+            return True
+        conn = sqlite_connection.reader()
+        row_count = conn.execute("SELECT COUNT(*) FROM message").fetchone()[0]
+        return abs(row_count - statistics.row_count) > (
+            STALE_FRACTION * statistics.row_count
+        )
+
+    @staticmethod
+    def get() -> Statistics | None:
+        """Get the statistics, None if never computed."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT stats, updated_at FROM {Statistics.table_name} "
+            "WHERE table_name = 'message'",
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return Statistics(**json.loads(row[0]), updated_at=row[1])
@@ -0,0 +1,55 @@
+"""Thread Model.
+
+Rows are aggregates of the message table, maintained by triggers, so
+the model is read only.
+"""
+
+from __future__ import annotations
+
+import json
+
+from mail_processor.database.connection import sqlite_connection
+
+
+class Thread:
+    """Model for thread table."""
+
+    table_name = "thread"
+
+    def __init__(
+        self,
+        thread_id: str,
+        message_count: int,
+        latest_date: int | None,
+        participants: list[str],
+    ) -> None:
+        """Initialize Thread attribute."""
+        self.thread_id = thread_id
+        self.message_count = message_count
+        self.latest_date = latest_date
+        self.participants = participants
+
+    @staticmethod
+    def from_row(row: tuple) -> Thread:
+        """Build a Thread from a row of the thread table."""
+        return Thread(
+            thread_id=row[0],
+            message_count=row[1],
+            latest_date=row[2],
+            participants=json.loads(row[3]),
+        )
+
+    @staticmethod
+    def get_by_thread_id(thread_id: str) -> Thread | None:
+        """Get By Thread Id."""
+        conn = sqlite_connection.reader()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT thread_id, message_count, latest_date, participants "
+            f"FROM {Thread.table_name} WHERE thread_id = ?",
+            (thread_id,),
+        )
+        thread = cursor.fetchone()
+        if thread:
+            return Thread.from_row(thread)
+        return None
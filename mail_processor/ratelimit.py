@@ -0,0 +1,71 @@
+"""Quota aware rate limiting shared between processes."""
+
+from __future__ import annotations
+
+import multiprocessing
+import time
+from multiprocessing.context import BaseContext
+
+__all__ = ["QuotaLimiter", "acquire", "install_limiter"]
+
+
+class QuotaLimiter:
+    """Token bucket of GMail quota units.
+
+    The bucket lives in shared memory, so a single limiter passed to
+    worker processes caps the quota used by all of them together.
+    """
+
+    def __init__(
+        self,
+        units_per_second: float,
+        *,
+        burst: float | None = None,
+        context: BaseContext | None = None,
+    ) -> None:
+        """Initialize a full bucket."""
+        context = context or multiprocessing.get_context()
+        self.rate = units_per_second
+        self.capacity = burst or units_per_second
+        self._lock = context.Lock()
+        self._tokens = context.Value("d", self.capacity, lock=False)
+        self._updated = context.Value("d", time.monotonic(), lock=False)
+
+    def acquire(self, units: float) -> float:
+        """Block until ``units`` are available and take them.
+
+        :return: the seconds spent waiting.
+        """
+        # NOTE: A single call may cost more than the bucket holds.
+        units = min(units, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens.value = min(
+                    self.capacity,
+                    self._tokens.value
+                    + (now - self._updated.value) * self.rate,
+                )
+                self._updated.value = now
+                if self._tokens.value >= units:
+                    self._tokens.value -= units
+                    return waited
+                wait = (units - self._tokens.value) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+_limiter: QuotaLimiter | None = None
+
+
+def install_limiter(limiter: QuotaLimiter | None) -> None:
+    """Limit the GMail calls of this process with ``limiter``."""
+    global _limiter  # noqa: PLW0603
+    _limiter = limiter
+
+
+def acquire(units: float) -> None:
+    """Take ``units`` from the installed limiter, if any."""
+    if _limiter is not None and units:
+        _limiter.acquire(units)
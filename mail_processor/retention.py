@@ -0,0 +1,280 @@
+"""Retention of the local database.
+
+Run after every sync, or on its own with the ``retention`` subcommand:
+
+- messages deleted upstream are evicted, they are the ones a complete
+  sync no longer listed.
+- bodies older than ``RETENTION_BODY_DAYS`` are dropped, the headers
+  are kept for the rules and reports.
+- above ``RETENTION_MAX_DB_MB`` the oldest bodies, then the oldest
+  messages are evicted until the database fits. A cap below the size of
+  the rest of the database, which evicting can't free, is reported
+  instead.
+
+Every change is written in small batches, each in its own transaction,
+and the freed pages are given back to the file system with incremental
+vacuum steps, so readers and other writers are never blocked for long.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import NamedTuple
+
+from mail_processor.config import app_config
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.database.migrations import triggers_suspended
+from mail_processor.logger import logger
+from mail_processor.metrics import metrics
+from mail_processor.models.message import Message
+from mail_processor.models.message_info import MessageInfo
+from mail_processor.models.sender import Sender
+from mail_processor.models.statistics import Statistics
+from mail_processor.models.thread import Thread
+
+__all__ = ["RetentionResult", "apply_retention", "run_retention"]
+
+# Messages changed per transaction.
+RETENTION_BATCH_SIZE = 1000
+
+# Pages given back per incremental vacuum step, 1 MB at 4 KB per page.
+VACUUM_PAGES_PER_STEP = 256
+
+BYTES_PER_MB = 1024 * 1024
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class RetentionResult(NamedTuple):
+    """What a retention run changed."""
+
+    evicted_deleted: int
+    dropped_bodies: int
+    evicted_for_size: int
+    freed_bytes: int
+
+    @property
+    def changed(self) -> int:
+        """Number of messages changed."""
+        return (
+            self.evicted_deleted + self.dropped_bodies + self.evicted_for_size
+        )
+
+
+def used_bytes() -> int:
+    """Bytes of the database in use, excluding the free pages."""
+    with sqlite_connection.writer() as conn:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return (page_count - free_pages) * page_size
+
+
+def unevictable_bytes() -> int:
+    """Bytes the database would still use with every message evicted.
+
+    Measured by deleting the messages, and the aggregates maintained
+    from them, in a savepoint which is then rolled back.
+    """
+    with sqlite_connection.writer() as conn:
+        conn.execute("SAVEPOINT unevictable")
+        try:
+            # NOTE: Without triggers, SQLite truncates the table instead
+            # of deleting the rows one by one.
+            with triggers_suspended(conn, Message.table_name):
+                for table_name in (
+                    Message.table_name,
+                    Thread.table_name,
+                    Sender.table_name,
+                ):
+                    conn.execute(f"DELETE FROM {table_name}")
+            return used_bytes()
+        finally:
+            conn.execute("ROLLBACK TO unevictable")
+            conn.execute("RELEASE unevictable")
+
+
+def evict_deleted(seen_since: int) -> int:
+    """Evict the messages not listed by the sync started at ``seen_since``.
+
+    :return: the number of messages evicted.
+    """
+    evicted = 0
+    while message_ids := MessageInfo.get_unseen_ids(
+        seen_since,
+        RETENTION_BATCH_SIZE,
+    ):
+        with sqlite_connection.writer():
+            Message.delete_many(message_ids)
+            MessageInfo.delete_many(message_ids)
+        evicted += len(message_ids)
+    return evicted
+
+
+def drop_old_bodies(days: int) -> int:
+    """Drop the bodies of messages older than ``days``.
+
+    :return: the number of bodies dropped.
+    """
+    before = int((time.time() - days * SECONDS_PER_DAY) * 1000)
+    dropped = 0
+    while bodies := Message.get_oldest_bodies(RETENTION_BATCH_SIZE, before):
+        Message.drop_bodies([message_id for message_id, _ in bodies])
+        dropped += len(bodies)
+    return dropped
+
+
+def drop_bodies_for_size(excess: float) -> int:
+    """Drop the oldest bodies, as many as add up to ``excess`` bytes.
+
+    :return: the number of bodies dropped.
+    """
+    message_ids = []
+    total = 0
+    for message_id, size in Message.get_oldest_bodies(RETENTION_BATCH_SIZE):
+        message_ids.append(message_id)
+        total += size
+        if total >= excess:
+            break
+    if message_ids:
+        Message.drop_bodies(message_ids)
+    return len(message_ids)
+
+
+def evict_for_size(excess: float, floor: int, at_least: int = 1) -> int:
+    """Evict the oldest messages, as many as take ``excess`` bytes.
+
+    Evicted messages are remembered, so that sync doesn't fetch them
+    again.
+
+    :param floor: Bytes used with every message evicted.
+    :param at_least: Messages to evict at least.
+    :return: the number of messages evicted.
+    """
+    count = Message.count()
+    evictable = used_bytes() - floor
+    if not count or evictable <= 0:
+        return 0
+    # NOTE: The indexes and aggregates of a message are freed with it,
+    # the average evictable size of a message accounts for them.
+    limit = min(
+        RETENTION_BATCH_SIZE,
+        max(at_least, math.ceil(excess / (evictable / count))),
+    )
+    message_ids = Message.get_oldest_ids(limit)
+    with sqlite_connection.writer():
+        Message.delete_many(message_ids)
+        MessageInfo.mark_evicted(message_ids, int(time.time() * 1000))
+    return len(message_ids)
+
+
+def enforce_max_size(max_mb: float) -> tuple[int, int]:
+    """Evict the oldest bodies, then messages, until the database fits.
+
+    Every step is sized from the bytes it frees, and the size checked
+    again after it, so that no more than needed is evicted. Messages
+    aren't evicted for a cap the database can't fit in even without
+    them.
+
+    :return: the number of bodies dropped and of messages evicted.
+    """
+    max_bytes = max_mb * BYTES_PER_MB
+    dropped = evicted = 0
+    floor = None
+    previous_excess = math.inf
+    at_least = 1
+    while (excess := used_bytes() - max_bytes) > 0:
+        if count := drop_bodies_for_size(excess):
+            dropped += count
+            continue
+        if floor is None:
+            floor = unevictable_bytes()
+            if floor >= max_bytes:
+                logger.warning(
+                    f"RETENTION_MAX_DB_MB of {max_mb} MB can't be reached, "
+                    f"{floor / BYTES_PER_MB:.1f} MB of the database can't "
+                    "be evicted. No messages were evicted.",
+                )
+                break
+        # NOTE: Space is freed a page at a time, a step which freed
+        # none is followed by a larger one.
+        at_least = at_least * 2 if excess >= previous_excess else 1
+        previous_excess = excess
+        if not (count := evict_for_size(excess, floor, at_least)):
+            break
+        evicted += count
+    return dropped, evicted
+
+
+def incremental_vacuum(pages_per_step: int = VACUUM_PAGES_PER_STEP) -> int:
+    """Give the free pages back to the file system, a step at a time.
+
+    :return: the number of bytes freed.
+    """
+    freed = 0
+    while True:
+        with sqlite_connection.writer() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                return freed
+            # NOTE: Through execute() sqlite3 steps the pragma once,
+            # freeing a single page. executescript() runs it to the end,
+            # committing first, which is why this is the outermost
+            # writer() block.
+            conn.executescript(f"PRAGMA incremental_vacuum({pages_per_step})")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        freed += (before - after) * page_size
+        if after >= before:
+            # NOTE: The database isn't in incremental auto vacuum mode.
+            return freed
+
+
+def apply_retention(seen_since: int | None = None) -> RetentionResult:
+    """Apply the configured retention.
+
+    :param seen_since: Start of a sync which listed the whole mailbox,
+        messages it didn't list are evicted.
+    """
+    evicted_deleted = dropped_bodies = evicted_for_size = 0
+    if seen_since is not None and app_config.RETENTION_EVICT_DELETED:
+        with metrics.phase("retention.deleted"):
+            evicted_deleted = evict_deleted(seen_since)
+    if app_config.RETENTION_BODY_DAYS is not None:
+        with metrics.phase("retention.bodies"):
+            dropped_bodies = drop_old_bodies(app_config.RETENTION_BODY_DAYS)
+    if app_config.RETENTION_MAX_DB_MB is not None:
+        with metrics.phase("retention.size"):
+            dropped, evicted_for_size = enforce_max_size(
+                app_config.RETENTION_MAX_DB_MB,
+            )
+            dropped_bodies += dropped
+    with metrics.phase("retention.vacuum"):
+        freed_bytes = incremental_vacuum()
+
+    result = RetentionResult(
+        evicted_deleted=evicted_deleted,
+        dropped_bodies=dropped_bodies,
+        evicted_for_size=evicted_for_size,
+        freed_bytes=freed_bytes,
+    )
+    if result.changed or freed_bytes:
+        logger.info(
+            f"Retention: evicted {evicted_deleted} messages deleted "
+            f"upstream and {evicted_for_size} for size, dropped "
+            f"{dropped_bodies} bodies, freed "
+            f"{freed_bytes / BYTES_PER_MB:.1f} MB.",
+        )
+    return result
+
+
+def run_retention() -> None:
+    """Entry point of the retention subcommand.
+
+    Messages deleted upstream are only known to a sync, they are left
+    to it.
+    """
+    apply_retention()
+    if Statistics.is_stale():
+        Statistics.refresh()
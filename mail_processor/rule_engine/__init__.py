@@ -8,56 +8,57 @@ from typing import Callable
 
 from pydantic import ValidationError
 
+from mail_processor.errors import UnknownLabelError
+from mail_processor.label_cache import LabelResolver
 from mail_processor.logger import logger
+from mail_processor.metrics import metrics
 from mail_processor.models.message import Message
+from mail_processor.models.statistics import Statistics
+from mail_processor.rule_engine.clauses import get_clause
+from mail_processor.rule_engine.optimizer import order_conditions
 from mail_processor.rule_engine.schema import (
     ActionsSchema,
     ActionTypes,
-    DateCondition,
     MoveAction,
     ReadAction,
     RuleSchema,
-    StrCondition,
     UnreadAction,
 )
 from mail_processor.services import GMailServices, ModifyBody
 
-__all__ = ["execute_rules"]
+__all__ = ["execute_rules", "get_clause", "get_where_clause"]
 
 
-def get_clause(condition: DateCondition | StrCondition) -> str:
-    field_name = condition.field_name.lower()
-    if isinstance(condition, DateCondition):
-        operator = "<"
-        if condition.predicate == "less than":
-            operator = ">"
-        value = f"DATE('now', '-{condition.value} {condition.unit}')"
-    else:
-        operator = "="
-        if condition.predicate == "contains":
-            operator = "LIKE"
-        elif condition.predicate == "does not contain":
-            operator = "NOT LIKE"
-        elif condition.predicate == "does not equal":
-            operator = "!="
+def get_where_clause(
+    rule_obj: RuleSchema,
+    statistics: Statistics | None = None,
+) -> tuple[str, list]:
+    """Combine the conditions of a rule into a WHERE clause.
 
-        # NOTE: To be in-case sensitive search in text column
-        field_name = f'LOWER("{field_name}")'
-        value = f"LOWER('{condition.value}')"
-
-    return f"{field_name} {operator} {value}"
-
-
-def filter_messages(rule_obj: RuleSchema) -> list[Message]:
+    Conditions are placed in the order picked by the optimizer, and
+    wrapped in ``likelihood()`` so that SQLite's planner only uses an
+    index for the ones expected to be selective.
+    """
     join_str = " OR "
     if rule_obj.predicate == "all":
         join_str = " AND "
 
-    where_clause = join_str.join(
-        get_clause(condition) for condition in rule_obj.conditions
-    )
+    sqls = []
+    params = []
+    for condition, estimate in order_conditions(rule_obj, statistics):
+        sql, condition_params = get_clause(condition)
+        # NOTE: likelihood() takes a literal between 0.0 and 1.0.
+        sqls.append(f"likelihood({sql}, {estimate.selectivity:.6f})")
+        params.extend(condition_params)
+    return join_str.join(sqls), params
+
 
-    return Message.get_by_filter(where_clause=where_clause)
+def filter_messages(
+    rule_obj: RuleSchema,
+    statistics: Statistics | None = None,
+) -> list[Message]:
+    where_clause, params = get_where_clause(rule_obj, statistics)
+    return Message.get_by_filter(where_clause=where_clause, params=params)
 
 
 class ActionExecutor:
@@ -69,6 +70,7 @@ class ActionExecutor:
         """Initialize Action Executor."""
         self.rule_obj = rule_obj
         self.filtered_message = filtered_messages
+        self.targets = self.__targets()
         self.service = GMailServices()
         self.action_map: dict[ActionTypes, Callable] = {
             "Mark as Read": self.__mark_as_read,
@@ -76,17 +78,53 @@ class ActionExecutor:
             "Move Message": self.__move_message,
         }
 
+    def __targets(self) -> list[str]:
+        """Ids to modify, the distinct threads for a thread scoped rule."""
+        if self.rule_obj.scope == "thread":
+            return list(
+                dict.fromkeys(
+                    message.thread_id for message in self.filtered_message
+                ),
+            )
+        return [message.message_id for message in self.filtered_message]
+
+    def __modify(self, body: ModifyBody) -> list[dict]:
+        """Apply the label changes to every target.
+
+        The stored labels of the targets modified are updated too, which
+        keeps the sender aggregates current until the next sync.
+        """
+        by_thread = self.rule_obj.scope == "thread"
+        results = []
+        try:
+            for target in self.targets:
+                if by_thread:
+                    result = self.service.modify_thread(
+                        thread_id=target,
+                        body=body,
+                    )
+                else:
+                    result = self.service.modify_message(
+                        message_id=target,
+                        body=body,
+                    )
+                results.append(result)
+        finally:
+            Message.modify_labels(
+                self.targets[: len(results)],
+                body["addLabelIds"],
+                body["removeLabelIds"],
+                by_thread=by_thread,
+            )
+        return results
+
     def __mark_as_read(self, __action: ReadAction) -> None:
         """Mark messages as Read."""
         body: ModifyBody = {
             "addLabelIds": [],
             "removeLabelIds": ["UNREAD"],
         }
-        for message in self.filtered_message:
-            self.service.modify_message(
-                message_id=message.message_id,
-                body=body,
-            )
+        self.__modify(body)
 
     def __mark_as_unread(self, __action: UnreadAction) -> None:
         """Mark messages as Unread."""
@@ -94,22 +132,14 @@ class ActionExecutor:
             "addLabelIds": ["UNREAD"],
             "removeLabelIds": [],
         }
-        for message in self.filtered_message:
-            self.service.modify_message(
-                message_id=message.message_id,
-                body=body,
-            )
+        self.__modify(body)
 
     def __move_message(self, __action: MoveAction) -> None:
         body: ModifyBody = {
             "addLabelIds": [__action.to],
             "removeLabelIds": [__action.from_],
         }
-        for message in self.filtered_message:
-            result = self.service.modify_message(
-                message_id=message.message_id,
-                body=body,
-            )
+        for result in self.__modify(body):
             logger.info(f"Move Result: {result}")
 
     def __run_action(self, action: ActionsSchema) -> None:
@@ -120,8 +150,13 @@ class ActionExecutor:
         """Execute all the actions."""
         for action in self.rule_obj.actions:
             self.__run_action(action)
+            metrics.record_rule(
+                self.rule_obj.name,
+                matches=0,
+                actions=len(self.targets),
+            )
             logger.info(
-                f"Processed {len(self.filtered_message)} messages "
+                f"Processed {len(self.targets)} {self.rule_obj.scope}s "
                 f"for rule: {self.rule_obj.name}",
             )
 
@@ -134,23 +169,73 @@ def get_rule_obj(rule: dict) -> None | RuleSchema:
         logger.error(e)
 
 
-def execute_rules(file_path: str) -> None:
-    """Entry point for rule execution."""
-    with Path(file_path).open() as fp:
-        rules = json.load(fp)
+def resolve_labels(rule_obj: RuleSchema, resolver: LabelResolver) -> None:
+    """Replace label names in the rule's actions with label IDs.
+
+    :raises UnknownLabelError: If a label does not exist.
+    """
+    for action in rule_obj.actions:
+        if isinstance(action, MoveAction):
+            action.to = resolver.resolve(action.to)
+            action.from_ = resolver.resolve(action.from_)
 
+
+def compile_rules(rules: list[dict]) -> list[RuleSchema] | None:
+    """Validate all the rules before any of them is executed.
+
+    Every rule is checked against the schema and the label cache so
+    that a typo is reported up front instead of partway through a run.
+
+    :return: the compiled rules, or None if any rule is invalid.
+    """
+    resolver = LabelResolver()
+    rule_objs = []
+    valid = True
     for i, rule in enumerate(rules):
         rule_obj = get_rule_obj(rule)
         if not rule_obj:
-            logger.warning(f"Skipping item in {i+1}")
+            logger.error(f"Invalid rule at position {i+1}")
+            valid = False
+            continue
+
+        try:
+            resolve_labels(rule_obj, resolver)
+        except UnknownLabelError as e:
+            logger.error(f"Invalid rule {rule_obj.name!r}: {e}")
+            valid = False
             continue
 
+        rule_objs.append(rule_obj)
+
+    return rule_objs if valid else None
+
+
+def execute_rules(file_path: str) -> None:
+    """Entry point for rule execution."""
+    with Path(file_path).open() as fp:
+        rules = json.load(fp)
+
+    with metrics.phase("execute.compile"):
+        rule_objs = compile_rules(rules)
+    if rule_objs is None:
+        logger.error("Invalid rules, no actions were executed.")
+        return
+
+    statistics = Statistics.get()
+    for rule_obj in rule_objs:
         logger.info(f"Processing rule: {rule_obj.name}")
 
-        filtered_messages = filter_messages(rule_obj)
+        with metrics.phase("execute.filter"):
+            filtered_messages = filter_messages(rule_obj, statistics)
+        metrics.record_rule(
+            rule_obj.name,
+            matches=len(filtered_messages),
+            actions=0,
+        )
         action_executor = ActionExecutor(
             rule_obj=rule_obj,
             filtered_messages=filtered_messages,
         )
 
-        action_executor.execute()
+        with metrics.phase("execute.actions"):
+            action_executor.execute()
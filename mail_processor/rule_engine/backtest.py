@@ -0,0 +1,223 @@
+"""Backtest rules against the local database.
+
+Nothing is sent to GMail: every rule and every one of its conditions is
+evaluated on the synced messages, timed and explained, and the cost of
+the rule's actions is estimated from the matches.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from mail_processor.constants import QUOTA_UNITS
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.errors import UnknownLabelError
+from mail_processor.label_cache import LabelResolver
+from mail_processor.logger import logger
+from mail_processor.models.message import Message
+from mail_processor.models.statistics import Statistics
+from mail_processor.rule_engine import (
+    get_clause,
+    get_rule_obj,
+    get_where_clause,
+    resolve_labels,
+)
+from mail_processor.rule_engine.optimizer import order_conditions
+from mail_processor.rule_engine.schema import (
+    ConditionSchema,
+    DateCondition,
+    DomainCondition,
+    RuleSchema,
+)
+
+__all__ = ["backtest_rules", "print_report"]
+
+# Domains of a domain condition shown before eliding the rest.
+DESCRIBE_DOMAINS = 3
+
+
+def describe(condition: ConditionSchema) -> str:
+    """Human readable condition."""
+    text = f"{condition.field_name} {condition.predicate} {condition.value}"
+    if isinstance(condition, DomainCondition):
+        domains = ", ".join(condition.value[:DESCRIBE_DOMAINS])
+        if len(condition.value) > DESCRIBE_DOMAINS:
+            domains = f"{domains}, ... ({len(condition.value)} domains)"
+        text = f"{condition.field_name} {condition.predicate} [{domains}]"
+    if isinstance(condition, DateCondition):
+        text = f"{text} {condition.unit}"
+    return text
+
+
+def explain(
+    conn: sqlite3.Connection,
+    where_clause: str,
+    params: list,
+) -> list[str]:
+    """Query plan of a filter, one line per step."""
+    cursor = conn.execute(
+        "EXPLAIN QUERY PLAN "
+        f"SELECT message_id FROM {Message.table_name} WHERE {where_clause}",
+        params,
+    )
+    return [row[3] for row in cursor.fetchall()]
+
+
+def measure(
+    conn: sqlite3.Connection,
+    clause: tuple[str, list],
+    total: int,
+) -> dict:
+    """Evaluate a filter.
+
+    :return: the matching messages and threads, selectivity, seconds
+        and query plan.
+    """
+    where_clause, params = clause
+    start = time.perf_counter()
+    matches, threads = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT thread_id) "
+        f"FROM {Message.table_name} WHERE {where_clause}",
+        params,
+    ).fetchone()
+    seconds = time.perf_counter() - start
+    return {
+        "matches": matches,
+        "threads": threads,
+        "selectivity": matches / total if total else 0.0,
+        "seconds": seconds,
+        "plan": explain(conn, where_clause, params),
+    }
+
+
+def count_messages(conn: sqlite3.Connection) -> int:
+    """Number of stored messages."""
+    return conn.execute(
+        f"SELECT COUNT(*) FROM {Message.table_name}",
+    ).fetchone()[0]
+
+
+def estimate_actions(rule_obj: RuleSchema, result: dict) -> dict:
+    """API calls and quota units the rule's actions would cost."""
+    method = f"{rule_obj.scope}s.modify"
+    targets = result["threads" if rule_obj.scope == "thread" else "matches"]
+    api_calls = targets * len(rule_obj.actions)
+    return {
+        "method": method,
+        "api_calls": api_calls,
+        "quota_units": api_calls * QUOTA_UNITS[method],
+    }
+
+
+def backtest_rule(
+    conn: sqlite3.Connection,
+    rule_obj: RuleSchema,
+    statistics: Statistics | None,
+    total: int,
+) -> dict:
+    """Evaluate a rule and each of its conditions, in evaluation order."""
+    result = measure(conn, get_where_clause(rule_obj, statistics), total)
+    return {
+        "name": rule_obj.name,
+        "predicate": rule_obj.predicate,
+        "scope": rule_obj.scope,
+        **result,
+        **estimate_actions(rule_obj, result),
+        "conditions": [
+            {
+                "condition": describe(condition),
+                "estimated_selectivity": estimate.selectivity,
+                "estimated_cost": estimate.cost,
+                **measure(conn, get_clause(condition), total),
+            }
+            for condition, estimate in order_conditions(rule_obj, statistics)
+        ],
+    }
+
+
+def backtest_rules(file_path: str) -> list[dict] | None:
+    """Backtest a rules file.
+
+    Labels are resolved against the local cache only, an unknown label
+    is reported but doesn't stop the backtest.
+
+    :return: a report per rule, or None if any rule is invalid.
+    """
+    with Path(file_path).open() as fp:
+        rules = json.load(fp)
+
+    resolver = LabelResolver(offline=True)
+    rule_objs = []
+    for i, rule in enumerate(rules):
+        rule_obj = get_rule_obj(rule)
+        if not rule_obj:
+            logger.error(f"Invalid rule at position {i+1}")
+            return None
+        try:
+            resolve_labels(rule_obj, resolver)
+        except UnknownLabelError as e:
+            logger.warning(f"Rule {rule_obj.name!r}: {e}")
+        rule_objs.append(rule_obj)
+
+    conn = sqlite_connection.reader()
+    statistics = Statistics.get()
+    total = count_messages(conn)
+    return [
+        backtest_rule(conn, rule_obj, statistics, total)
+        for rule_obj in rule_objs
+    ]
+
+
+def print_report(
+    reports: list[dict],
+    *,
+    as_json: bool = False,
+    title: str = "Backtest",
+) -> None:
+    """Print the backtest as a table, or as JSON."""
+    if as_json:
+        print(json.dumps(reports, indent=2))  # noqa: T201
+        return
+
+    table = Table(title=title)
+    table.add_column("Rule / condition")
+    table.add_column("Matches", justify="right")
+    table.add_column("Selectivity", justify="right")
+    table.add_column("Est.", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("API calls", justify="right")
+    table.add_column("Quota units", justify="right")
+    table.add_column("Plan")
+    for report in reports:
+        table.add_row(
+            f"[bold]{escape(report['name'])}[/bold] "
+            f"({report['predicate']}, {report['scope']})",
+            str(report["matches"]),
+            f"{report['selectivity']:.2%}",
+            "",
+            f"{report['seconds'] * 1000:.1f}",
+            str(report["api_calls"]),
+            str(report["quota_units"]),
+            "\n".join(report["plan"]),
+        )
+        for condition in report["conditions"]:
+            table.add_row(
+                f"  {escape(condition['condition'])}",
+                str(condition["matches"]),
+                f"{condition['selectivity']:.2%}",
+                f"{condition['estimated_selectivity']:.2%}",
+                f"{condition['seconds'] * 1000:.1f}",
+                "",
+                "",
+                "\n".join(condition["plan"]),
+            )
+        table.add_section()
+
+    Console().print(table)
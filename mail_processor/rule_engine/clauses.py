@@ -0,0 +1,160 @@
+"""SQL expressions of the rule conditions.
+
+Values are always bound as parameters, never formatted into the SQL.
+"""
+
+from __future__ import annotations
+
+import json
+
+from mail_processor.models.message import Message
+from mail_processor.models.sender import Sender
+from mail_processor.models.thread import Thread
+from mail_processor.rule_engine.schema import (
+    ConditionSchema,
+    DateCondition,
+    DomainCondition,
+    RegexCondition,
+    StrCondition,
+    ThreadCondition,
+)
+
+__all__ = ["get_clause", "get_sender_match"]
+
+# Escape character of LIKE patterns.
+LIKE_ESCAPE = "\\"
+
+# Predicates matching the values a positive predicate doesn't.
+NEGATED_PREDICATES = {
+    "does not contain",
+    "does not equal",
+    "does not match regex",
+}
+
+# Thread condition fields, as expressions on the thread table.
+THREAD_FIELDS = {
+    "Thread Messages": "message_count",
+    "Thread Participants": "json_array_length(participants)",
+}
+
+
+def get_thread_clause(condition: ThreadCondition) -> tuple[str, list]:
+    """Compare an aggregate of the message's thread.
+
+    The thread row is a single primary key lookup per message.
+    """
+    operator = "="
+    if condition.predicate == "less than":
+        operator = "<"
+    elif condition.predicate == "greater than":
+        operator = ">"
+
+    return (
+        f"(SELECT {THREAD_FIELDS[condition.field_name]} "
+        f"FROM {Thread.table_name} "
+        f"WHERE {Thread.table_name}.thread_id = "
+        f"{Message.table_name}.thread_id) {operator} ?",
+        [condition.value],
+    )
+
+
+def escape_like(value: str) -> str:
+    """Escape the LIKE wildcards of a value, with ``LIKE_ESCAPE``."""
+    return (
+        value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+        .replace("%", f"{LIKE_ESCAPE}%")
+        .replace("_", f"{LIKE_ESCAPE}_")
+    )
+
+
+def get_domain_clause(condition: DomainCondition) -> tuple[str, list]:
+    """Match the sender domain against a list, in one indexed lookup.
+
+    The domains are bound as a single JSON array, so the list can be
+    as long as needed.
+    """
+    if condition.predicate == "in":
+        return (
+            "from_domain IN (SELECT value FROM json_each(?))",
+            [json.dumps(condition.value)],
+        )
+    return (
+        "COALESCE(from_domain, '') NOT IN (SELECT value FROM json_each(?))",
+        [json.dumps(condition.value)],
+    )
+
+
+def get_text_match(
+    column: str,
+    condition: StrCondition | RegexCondition,
+) -> tuple[str, list]:
+    """Positive form of a text condition on ``column``."""
+    if isinstance(condition, RegexCondition):
+        return f"{column} REGEXP ?", [condition.value]
+
+    # NOTE: To be in-case sensitive search in text column
+    if condition.predicate in {"contains", "does not contain"}:
+        return (
+            f"LOWER({column}) LIKE LOWER(?) ESCAPE '{LIKE_ESCAPE}'",
+            [f"%{escape_like(condition.value)}%"],
+        )
+    return f"LOWER({column}) = LOWER(?)", [condition.value]
+
+
+def get_sender_match(
+    condition: StrCondition | RegexCondition,
+) -> tuple[str, list]:
+    """Positive form of a From condition on the sender table."""
+    if condition.predicate in {"equals", "does not equal"}:
+        return "address = LOWER(?)", [condition.value]
+    return get_text_match("address", condition)
+
+
+def get_sender_clause(
+    condition: StrCondition | RegexCondition,
+) -> tuple[str, list]:
+    """From condition, resolved through the sender table.
+
+    Addresses are stored lower cased, so equality is a lookup on the
+    message_from index. The other predicates are evaluated once per
+    sender instead of once per message, the matching addresses are
+    then looked up on the same index.
+    """
+    negated = condition.predicate in NEGATED_PREDICATES
+    if condition.predicate in {"equals", "does not equal"}:
+        operator = "!=" if negated else "="
+        return f'"from" {operator} LOWER(?)', [condition.value]
+
+    match, params = get_sender_match(condition)
+    operator = "NOT IN" if negated else "IN"
+    return (
+        f'"from" {operator} '
+        f"(SELECT address FROM {Sender.table_name} WHERE {match})",
+        params,
+    )
+
+
+def get_clause(condition: ConditionSchema) -> tuple[str, list]:
+    """SQL expression of a condition and its parameters."""
+    if isinstance(condition, ThreadCondition):
+        return get_thread_clause(condition)
+    if isinstance(condition, DomainCondition):
+        return get_domain_clause(condition)
+
+    field_name = condition.field_name.lower()
+    if isinstance(condition, DateCondition):
+        operator = "<"
+        if condition.predicate == "less than":
+            operator = ">"
+        return (
+            f"{field_name} {operator} DATE('now', ?)",
+            [f"-{condition.value} {condition.unit}"],
+        )
+
+    if condition.field_name == "From":
+        return get_sender_clause(condition)
+
+    match, params = get_text_match(f'"{field_name}"', condition)
+    if condition.predicate in NEGATED_PREDICATES:
+        return f"NOT ({match})", params
+    return match, params
@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+import re
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from mail_processor.database.functions import compile_pattern
 
 StrPredicateT = Literal[
     "contains",
@@ -12,7 +15,10 @@ StrPredicateT = Literal[
     "equals",
     "does not equal",
 ]
+RegexPredicateT = Literal["matches regex", "does not match regex"]
+DomainPredicateT = Literal["in", "not in"]
 DatePredicateT = Literal["less than", "greater than"]
+ThreadPredicateT = Literal["less than", "greater than", "equals"]
 
 
 class StrCondition(BaseModel):
@@ -23,6 +29,39 @@ class StrCondition(BaseModel):
     value: str
 
 
+class RegexCondition(BaseModel):
+    """Regex Condition, case-insensitive and matching anywhere."""
+
+    field_name: Literal["From", "To", "Subject", "Body"]
+    predicate: RegexPredicateT
+    value: str
+
+    @field_validator("value")
+    @classmethod
+    def validate_pattern(cls, value: str) -> str:
+        """Reject patterns which don't compile."""
+        try:
+            compile_pattern(value)
+        except re.error as e:
+            msg = f"Invalid regex {value!r}: {e}"
+            raise ValueError(msg) from e
+        return value
+
+
+class DomainCondition(BaseModel):
+    """Sender Domain Condition, against a list of domains."""
+
+    field_name: Literal["From Domain"]
+    predicate: DomainPredicateT
+    value: list[str] = Field(min_length=1)
+
+    @field_validator("value")
+    @classmethod
+    def normalize_domains(cls, value: list[str]) -> list[str]:
+        """Lower case the domains, accepting a leading ``@``."""
+        return [domain.strip().lstrip("@").lower() for domain in value]
+
+
 class DateCondition(BaseModel):
     """Date Condition."""
 
@@ -32,6 +71,22 @@ class DateCondition(BaseModel):
     unit: Literal["days", "months"]
 
 
+class ThreadCondition(BaseModel):
+    """Thread Condition, on the conversation of the message."""
+
+    field_name: Literal["Thread Messages", "Thread Participants"]
+    predicate: ThreadPredicateT
+    value: int
+
+
+ConditionSchema = (
+    StrCondition
+    | RegexCondition
+    | DomainCondition
+    | DateCondition
+    | ThreadCondition
+)
+
 ActionTypes = Literal[
     "Move Message",
     "Mark as Read",
@@ -40,7 +95,11 @@ ActionTypes = Literal[
 
 
 class MoveAction(BaseModel):
-    """Move Action."""
+    """Move Action.
+
+    ``to`` and ``from`` take a label name or ID, names are resolved to
+    IDs against the label cache before the rules run.
+    """
 
     type: Literal["Move Message"]
     to: str
@@ -63,9 +122,14 @@ ActionsSchema = MoveAction | ReadAction | UnreadAction
 
 
 class RuleSchema(BaseModel):
-    """Rule Schema."""
+    """Rule Schema.
+
+    With ``scope`` "thread" the actions apply to the whole conversation
+    of every matching message, with one call per thread.
+    """
 
     name: str
     predicate: Literal["all", "any"]
-    conditions: list[StrCondition | DateCondition]
+    scope: Literal["message", "thread"] = "message"
+    conditions: list[ConditionSchema]
     actions: list[ActionsSchema]
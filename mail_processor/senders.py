@@ -0,0 +1,75 @@
+"""Report of the senders in the local database.
+
+Served from the sender table, which the sync keeps up to date, so the
+report never scans the messages.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime
+
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from mail_processor.models.sender import Sender
+
+__all__ = ["get_senders", "print_senders"]
+
+
+def format_seen(internal_date: int | None) -> str:
+    """Day of an internal date."""
+    if internal_date is None:
+        return ""
+    return datetime.fromtimestamp(internal_date / 1000, UTC).date().isoformat()
+
+
+def get_senders(
+    limit: int,
+    order_by: str,
+    *,
+    by_domain: bool = False,
+) -> list[dict]:
+    """Get the top senders, or sender domains."""
+    return [
+        {
+            "domain" if by_domain else "address": sender.address,
+            "message_count": sender.message_count,
+            "unread_count": sender.unread_count,
+            "first_seen": format_seen(sender.first_seen),
+            "last_seen": format_seen(sender.last_seen),
+        }
+        for sender in Sender.get_top(limit, order_by, by_domain=by_domain)
+    ]
+
+
+def print_senders(
+    senders: list[dict],
+    *,
+    by_domain: bool = False,
+    as_json: bool = False,
+    title: str | None = None,
+) -> None:
+    """Print the senders, or sender domains, as a table or as JSON."""
+    if as_json:
+        print(json.dumps(senders, indent=2))  # noqa: T201
+        return
+
+    table = Table(title=title or ("Domains" if by_domain else "Senders"))
+    table.add_column("Domain" if by_domain else "Address")
+    table.add_column("Messages", justify="right")
+    table.add_column("Unread", justify="right")
+    table.add_column("Unread %", justify="right")
+    table.add_column("First seen")
+    table.add_column("Last seen")
+    for sender in senders:
+        table.add_row(
+            escape(sender["domain" if by_domain else "address"]),
+            str(sender["message_count"]),
+            str(sender["unread_count"]),
+            f"{sender['unread_count'] / sender['message_count']:.0%}",
+            sender["first_seen"],
+            sender["last_seen"],
+        )
+    Console().print(table)
@@ -3,16 +3,64 @@
 from __future__ import annotations
 
 import base64
+import random
 import re
+import threading
+import time
 from email.utils import parsedate_to_datetime
-from typing import Generator, Self, TypedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Generator, Self, TypedDict
 
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
 
-from mail_processor.authenticate import get_credentials
+from mail_processor import ratelimit
+from mail_processor.authenticate import (
+    CredentialsRefresher,
+    get_credentials,
+)
+from mail_processor.config import app_config
+from mail_processor.constants import (
+    API_NUM_RETRIES,
+    BATCH_SIZE,
+    QUOTA_UNITS,
+)
 from mail_processor.logger import logger
+from mail_processor.metrics import metrics
 from mail_processor.models.message import Message
 
+if TYPE_CHECKING:
+    from googleapiclient.http import BatchHttpRequest, HttpRequest
+    from httplib2 import Http
+
+
+HTTP_NOT_FOUND = 404
+RETRY_STATUS_CODES = {429, 500, 503}
+HTTP_FORBIDDEN = 403
+
+# Longest wait between two retries, in seconds.
+MAX_BACKOFF = 32
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request may succeed when retried.
+
+    Rate limits are answered with a 429, or a 403 with a rate limit
+    reason, server errors and dropped connections are transient.
+    """
+    if isinstance(error, HttpError):
+        return error.status_code in RETRY_STATUS_CODES or (
+            error.status_code == HTTP_FORBIDDEN
+            and b"ratelimitexceeded" in (error.content or b"").lower()
+        )
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retrying, with full jitter."""
+    return random.uniform(0, min(2**attempt, MAX_BACKOFF))  # noqa: S311
+
 
 class ModifyBody(TypedDict):
     """Modify Body."""
@@ -43,9 +91,66 @@ email_regex = re.compile(r"<(.*?)>")
 
 
 def get_email(from_: str) -> str:
-    """Parse email."""
+    """Parse email, lower cased."""
     email_match = email_regex.search(from_)
-    return email_match.group(1)
+    return (email_match.group(1) if email_match else from_).strip().lower()
+
+
+def parse_message(result: dict) -> Message:
+    """Parse a full message resource from GMail API."""
+    message = {}
+    headers = result["payload"]["headers"]
+    key_map = {
+        "From": "from",
+        "To": "to",
+        "Subject": "subject",
+        "Date": "date",
+    }
+    get_value_map = {
+        "from": get_email,
+        "date": lambda val: parsedate_to_datetime(
+            val,
+        ).isoformat(),
+    }
+    for header in headers:
+        name = header["name"]
+        key = key_map.get(name)
+        if key:
+            value = get_value_map.get(key, lambda val: val)(
+                header["value"],
+            )
+            message[key] = value
+
+    return Message(
+        message_id=result["id"],
+        thread_id=result["threadId"],
+        from_=message.get("from"),
+        to=message.get("to"),
+        subject=message.get("subject"),
+        date=message.get("date"),
+        body=decode_message(result),
+        label_ids=result.get("labelIds", []),
+        internal_date=int(result["internalDate"]),
+        size_estimate=result.get("sizeEstimate"),
+    )
+
+
+def load_discovery_document(
+    service_name: str = "gmail",
+    version: str = "v1",
+) -> str | None:
+    """Load the discovery document without hitting the network.
+
+    The local copy configured by ``DISCOVERY_DOC_PATH`` takes
+    precedence over the static copy packaged with googleapiclient.
+    """
+    if app_config.DISCOVERY_DOC_PATH:
+        path = Path(app_config.DISCOVERY_DOC_PATH)
+        if path.exists():
+            return path.read_text()
+        logger.debug(f"Discovery document not found at {path}")
+
+    return get_static_doc(service_name, version)
 
 
 class GMailServices:
@@ -53,15 +158,27 @@ class GMailServices:
 
     _instance = None
 
-    def __init__(self) -> None:
-        """Initialize the GMail Service."""
-        if self._instance is self:
-            self.credentials = get_credentials()
-            self.service = build(
-                "gmail",
-                "v1",
-                credentials=self.credentials,
-            )
+    def __init__(self, http: Http | None = None) -> None:
+        """Initialize the GMail Service.
+
+        :param http: An already authorized http object, used instead of
+            the stored credentials. Benchmarks pass a fake GMail here.
+        """
+        if self._instance is self and not hasattr(self, "service"):
+            self._shared_http = http
+            self._local = threading.local()
+            auth: dict = {"http": http}
+            if http is None:
+                self.credentials = get_credentials()
+                self.refresher = CredentialsRefresher(self.credentials)
+                self.refresher.start()
+                auth = {"credentials": self.credentials}
+
+            document = load_discovery_document()
+            if document is None:
+                self.service = build("gmail", "v1", **auth)
+            else:
+                self.service = build_from_document(document, **auth)
 
     def __new__(cls, *args, **kwargs) -> Self:  # noqa: ANN002, ANN003, ARG003
         """Singleton instance."""
@@ -71,77 +188,191 @@ class GMailServices:
             )
         return cls._instance
 
+    def _http(self) -> Http:
+        """Http object of the calling thread.
+
+        httplib2 is not thread safe, so every thread gets its own
+        authorized http object sharing the credentials.
+        """
+        if self._shared_http is not None:
+            return self._shared_http
+
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from google_auth_httplib2 import AuthorizedHttp
+            from googleapiclient.http import build_http
+
+            http = AuthorizedHttp(self.credentials, http=build_http())
+            self._local.http = http
+        return http
+
+    def _execute(self, request: HttpRequest, method: str) -> dict:
+        """Execute a request, recording every attempt in the metrics.
+
+        Retries are made here rather than by googleapiclient, so that
+        each attempt takes its quota units from the shared limiter.
+        """
+        units = QUOTA_UNITS.get(method, 0)
+        attempt = 0
+        while True:
+            ratelimit.acquire(units)
+            start = time.perf_counter()
+            error = False
+            try:
+                return request.execute(http=self._http())
+            except Exception as e:
+                error = True
+                if attempt == API_NUM_RETRIES or not is_retryable(e):
+                    raise
+                logger.debug(f"Retrying {method} after: {e}")
+            finally:
+                metrics.record_api_call(
+                    method,
+                    time.perf_counter() - start,
+                    units,
+                    error=error,
+                )
+            time.sleep(backoff(attempt))
+            attempt += 1
+
+    def _execute_batch(
+        self,
+        batch: BatchHttpRequest,
+        method: str,
+        size: int,
+    ) -> None:
+        """Execute a batch request, recording each request it carries.
+
+        The round-trip's latency is split evenly between the requests.
+        """
+        ratelimit.acquire(QUOTA_UNITS.get(method, 0) * size)
+        start = time.perf_counter()
+        error = False
+        try:
+            batch.execute(http=self._http())
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) / size
+            for _ in range(size):
+                metrics.record_api_call(
+                    method,
+                    elapsed,
+                    QUOTA_UNITS.get(method, 0),
+                    error=error,
+                )
+
     def get_message_infos(self) -> Generator:
         """Get messages."""
         page_token = None
         while True:
-            results = (
+            results = self._execute(
                 self.service.users()
                 .messages()
-                .list(userId="me", pageToken=page_token)
-                .execute()
+                .list(userId="me", pageToken=page_token),
+                "messages.list",
             )
-            yield results["messages"]
+            yield results.get("messages", [])
             page_token = results.get("nextPageToken")
             if not page_token:
                 break
 
-    def get_message(self, message_id: str) -> Message:
-        """Get Message."""
-        result = (
+    def fetch_message(self, message_id: str) -> dict:
+        """Fetch the full message resource."""
+        return self._execute(
             self.service.users()
             .messages()
-            .get(userId="me", id=message_id, format="full")
-            .execute()
-        )
-        message = {}
-        headers = result["payload"]["headers"]
-        key_map = {
-            "From": "from",
-            "To": "to",
-            "Subject": "subject",
-            "Date": "date",
-        }
-        get_value_map = {
-            "from": get_email,
-            "date": lambda val: parsedate_to_datetime(
-                val,
-            ).isoformat(),
-        }
-        for header in headers:
-            name = header["name"]
-            key = key_map.get(name)
-            if key:
-                value = get_value_map.get(key, lambda val: val)(
-                    header["value"],
-                )
-                message[key] = value
-
-        return Message(
-            message_id=result["id"],
-            thread_id=result["threadId"],
-            from_=message["from"],
-            to=message["to"],
-            subject=message["subject"],
-            date=message["date"],
-            body=decode_message(result),
+            .get(userId="me", id=message_id, format="full"),
+            "messages.get",
         )
 
+    def get_messages_metadata(
+        self,
+        message_ids: list[str],
+    ) -> tuple[dict[str, dict], list[str]]:
+        """Fetch ``format=minimal`` resources with batch requests.
+
+        Requests rate limited inside a batch are retried in the next
+        round. Ids still rate limited after the last round are in
+        neither of the results.
+
+        :return: resources by message id, and the ids of the messages
+            which no longer exist.
+        """
+        resources: dict[str, dict] = {}
+        not_found: list[str] = []
+        pending = list(message_ids)
+        for attempt in range(API_NUM_RETRIES + 1):
+            throttled: list[str] = []
+
+            def callback(
+                request_id: str,
+                response: dict,
+                exception: HttpError | None,
+                throttled: list[str] = throttled,
+            ) -> None:
+                if exception is None:
+                    resources[request_id] = response
+                elif exception.status_code in RETRY_STATUS_CODES:
+                    throttled.append(request_id)
+                elif exception.status_code == HTTP_NOT_FOUND:
+                    not_found.append(request_id)
+                else:
+                    raise exception
+
+            for start in range(0, len(pending), BATCH_SIZE):
+                batch = self.service.new_batch_http_request(callback=callback)
+                chunk = pending[start : start + BATCH_SIZE]
+                for message_id in chunk:
+                    batch.add(
+                        self.service.users()
+                        .messages()
+                        .get(userId="me", id=message_id, format="minimal"),
+                        request_id=message_id,
+                    )
+                self._execute_batch(batch, "messages.get", len(chunk))
+
+            if not throttled or attempt == API_NUM_RETRIES:
+                break
+            pending = throttled
+            time.sleep(backoff(attempt))
+
+        return resources, not_found
+
+    def get_message(self, message_id: str) -> Message:
+        """Get Message."""
+        return parse_message(self.fetch_message(message_id))
+
     def modify_message(
         self,
         message_id: str,
         body: ModifyBody,
     ) -> dict:
         """Add / remove the labels."""
-        return (
+        return self._execute(
             self.service.users()
             .messages()
-            .modify(userId="me", id=message_id, body=body)
-            .execute()
+            .modify(userId="me", id=message_id, body=body),
+            "messages.modify",
+        )
+
+    def modify_thread(
+        self,
+        thread_id: str,
+        body: ModifyBody,
+    ) -> dict:
+        """Add / remove the labels of every message in a thread."""
+        return self._execute(
+            self.service.users()
+            .threads()
+            .modify(userId="me", id=thread_id, body=body),
+            "threads.modify",
         )
 
     def get_labels(self) -> list[dict]:
         """Get all the labels."""
-        return (
-            self.service.users().labels().list(userId="me").execute()
+        return self._execute(
+            self.service.users().labels().list(userId="me"),
+            "labels.list",
         )
@@ -1,55 +1,286 @@
-"""Synchronize local DB with Gmail Mails."""
+"""Synchronize local DB with Gmail Mails.
 
+Sync runs as a streaming pipeline::
+
+    list pages -> fetch workers -> parse -> writer
+
+Stages are connected by bounded queues, a slow stage blocks the ones
+feeding it, so memory stays constant regardless of the mailbox size and
+the first messages are written as soon as they are fetched.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+from googleapiclient.errors import HttpError
 from rich.progress import Progress
 
+from mail_processor.config import app_config
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.database.migrations import run_backfills
+from mail_processor.errors import RateLimitedError
 from mail_processor.logger import logger
+from mail_processor.metrics import metrics
 from mail_processor.models.message import Message
 from mail_processor.models.message_info import MessageInfo
-from mail_processor.services import GMailServices
+from mail_processor.models.statistics import Statistics
+from mail_processor.retention import apply_retention
+from mail_processor.services import (
+    HTTP_NOT_FOUND,
+    GMailServices,
+    parse_message,
+)
 
-__all__ = ["sync_emails"]
+__all__ = ["SyncPipeline", "sync_emails"]
 
+# Marks the end of a stage's output.
+DONE = object()
 
-def sync_emails(*, refresh: bool = False) -> None:
-    """Synchronize the mails."""
-    service = GMailServices()
+# Seconds a blocked stage waits before checking for a shutdown.
+POLL_INTERVAL = 0.1
+
+
+class PipelineStoppedError(Exception):
+    """Raised inside a stage when another stage failed."""
+
+
+class SyncPipeline:
+    """Streaming sync of the mailbox into the local DB."""
+
+    def __init__(
+        self,
+        service: GMailServices,
+        *,
+        workers: int | None = None,
+        queue_size: int | None = None,
+        batch_size: int | None = None,
+    ) -> None:
+        """Initialize the stages and queues."""
+        self.service = service
+        self.workers = workers or app_config.SYNC_FETCH_WORKERS
+        self.batch_size = batch_size or app_config.SYNC_WRITE_BATCH_SIZE
+        queue_size = queue_size or app_config.SYNC_QUEUE_SIZE
+
+        self.fetch_queue: queue.Queue = queue.Queue(queue_size)
+        self.parse_queue: queue.Queue = queue.Queue(queue_size)
+        self.write_queue: queue.Queue = queue.Queue(queue_size)
+
+        self.stopped = threading.Event()
+        self.errors: list[BaseException] = []
+        # NOTE: Marks the messages listed by this sync, in milliseconds.
+        self.started = int(time.time() * 1000)
+        self.listed = 0
+        self.discovered = 0
+        self.written = 0
+
+    def _put(self, target: queue.Queue, item: Any) -> None:  # noqa: ANN401
+        """Put into a bounded queue, giving up if the pipeline stopped."""
+        while True:
+            if self.stopped.is_set():
+                raise PipelineStoppedError
+            try:
+                target.put(item, timeout=POLL_INTERVAL)
+            except queue.Full:
+                continue
+            return
+
+    def _get(self, source: queue.Queue) -> Any:  # noqa: ANN401
+        """Get from a queue, giving up if the pipeline stopped."""
+        while True:
+            if self.stopped.is_set():
+                raise PipelineStoppedError
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _stage(self, target: Callable) -> Callable:
+        """Wrap a stage so that a failure stops the whole pipeline."""
+
+        def run() -> None:
+            try:
+                target()
+            except PipelineStoppedError:
+                pass
+            except BaseException as e:  # noqa: BLE001
+                self.errors.append(e)
+                self.stopped.set()
+            finally:
+                sqlite_connection.close()
+
+        return run
+
+    def list_stage(self) -> None:
+        """Page through the mailbox, queueing messages not synced yet."""
+        with metrics.phase("sync.list"):
+            for message_infos in self.service.get_message_infos():
+                self.listed += len(message_infos)
+                self._put(
+                    self.write_queue,
+                    [
+                        MessageInfo(
+                            message_id=message_info["id"],
+                            thread_id=message_info["threadId"],
+                            seen_at=self.started,
+                        )
+                        for message_info in message_infos
+                    ],
+                )
+                for message_id in Message.get_missing_ids(
+                    [message_info["id"] for message_info in message_infos],
+                ):
+                    self.discovered += 1
+                    self._put(self.fetch_queue, message_id)
+
+        for _ in range(self.workers):
+            self._put(self.fetch_queue, DONE)
+
+    def fetch_stage(self) -> None:
+        """Fetch full messages."""
+        while (message_id := self._get(self.fetch_queue)) is not DONE:
+            try:
+                result = self.service.fetch_message(message_id)
+            except HttpError as e:
+                # NOTE: Deleted between listing and fetching.
+                if e.status_code != HTTP_NOT_FOUND:
+                    raise
+                logger.debug(f"Message {message_id} no longer exists.")
+                continue
+            self._put(self.parse_queue, result)
 
-    for message_infos in service.get_message_infos():
-        message_objects = [
-            MessageInfo(
-                message_id=message_info["id"],
-                thread_id=message_info["threadId"],
+        self._put(self.parse_queue, DONE)
+
+    def parse_stage(self) -> None:
+        """Parse the fetched messages."""
+        running = self.workers
+        while running:
+            result = self._get(self.parse_queue)
+            if result is DONE:
+                running -= 1
+                continue
+            self._put(self.write_queue, parse_message(result))
+
+        self._put(self.write_queue, DONE)
+
+    def write_stage(self, progress: Progress, task: int) -> None:
+        """Write to the DB in batches, on the calling thread."""
+        batch: list[Message] = []
+
+        def flush() -> None:
+            if batch:
+                Message.bulk_insert(batch)
+                self.written += len(batch)
+                batch.clear()
+            progress.update(
+                task,
+                total=self.discovered,
+                completed=self.written,
             )
-            for message_info in message_infos
+
+        while True:
+            try:
+                item = self.write_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # NOTE: Nothing arriving, don't hold on to a partial batch.
+                flush()
+                if self.stopped.is_set():
+                    raise PipelineStoppedError from None
+                continue
+
+            if item is DONE:
+                flush()
+                return
+            if isinstance(item, list):
+                MessageInfo.bulk_insert(item)
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                flush()
+
+    def run(self) -> int:
+        """Run the pipeline to completion.
+
+        :return: the number of messages written.
+        """
+        threads = [
+            threading.Thread(
+                target=self._stage(self.list_stage),
+                name="sync-list",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._stage(self.parse_stage),
+                name="sync-parse",
+                daemon=True,
+            ),
+        ] + [
+            threading.Thread(
+                target=self._stage(self.fetch_stage),
+                name=f"sync-fetch-{i}",
+                daemon=True,
+            )
+            for i in range(self.workers)
         ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            with Progress() as progress, metrics.phase("sync.write"):
+                task = progress.add_task("Syncing...", total=None)
+                self.write_stage(progress, task)
+        except PipelineStoppedError:
+            pass
+        except BaseException:
+            self.stopped.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
 
-        MessageInfo.bulk_insert(message_objects)
+        if self.errors:
+            raise self.errors[0]
+        return self.written
+
+
+def sync_emails(*, refresh: bool = False) -> None:
+    """Synchronize the mails."""
+    service = GMailServices()
 
     if refresh:
         Message.delete_all()
-        message_infos = MessageInfo.get_all()
-    else:
-        message_ids = [
-            message.message_id for message in Message.get_all()
-        ]
 
-        message_infos = (
-            MessageInfo.get_message_infos_by_ids(
-                message_ids,
-            )
-            if message_ids
-            else MessageInfo.get_all()
+    try:
+        with metrics.phase("sync.backfill"):
+            run_backfills(service)
+    except RateLimitedError as e:
+        # NOTE: The backfill resumes from the rows left on the next sync,
+        # new mail is synced regardless.
+        logger.warning(f"Backfill paused: {e}")
+
+    pipeline = SyncPipeline(service)
+    with metrics.phase("sync"):
+        written = pipeline.run()
+
+    # NOTE: An empty listing is more likely an API hiccup than an empty
+    # mailbox, don't evict everything on it.
+    if not pipeline.listed:
+        logger.warning("No messages listed, skipping the eviction.")
+    with metrics.phase("sync.retention"):
+        apply_retention(
+            seen_since=pipeline.started if pipeline.listed else None,
         )
 
-    if not message_infos:
+    if refresh or Statistics.is_stale():
+        with metrics.phase("sync.statistics"):
+            Statistics.refresh()
+
+    if not written:
         logger.info("Already synced with mail.")
         return
 
-    with Progress() as progress:
-        task = progress.add_task(
-            "Syncing...",
-            total=len(message_infos),
-        )
-        for message_info_obj in message_infos:
-            service.get_message(message_info_obj.message_id).save()
-            progress.update(task, advance=1)
+    logger.info(f"Synced {written} messages.")
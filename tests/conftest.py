@@ -0,0 +1,134 @@
+"""Fixtures shared by the tests, every test gets its own database."""
+
+from __future__ import annotations
+
+import os
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import pytest
+
+# NOTE: Settings are read when mail_processor.config is first imported.
+os.environ.setdefault("CREDENTIALS_JSON_PATH", ".secrets/credentials.json")
+os.environ.setdefault("TOKEN_JSON_PATH", ".secrets/token.json")
+os.environ.setdefault("SQLITE_DB", ".data/db.sqlite")
+
+from mail_processor.config import app_config  # noqa: E402
+from mail_processor.database.connection import sqlite_connection  # noqa: E402
+from mail_processor.models import (  # noqa: E402
+    Message,
+    MessageInfo,
+    initialize_models,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+NOW = datetime.now(UTC).replace(microsecond=0)
+
+
+class FakeGMail:
+    """Stands in for ``GMailServices``, counting the calls by method."""
+
+    def __init__(self) -> None:
+        """Initialize without labels."""
+        self.labels: list[dict] = []
+        self.calls: Counter[str] = Counter()
+        self.modified: list[tuple[str, str, dict]] = []
+
+    def get_labels(self) -> dict:
+        """Labels of the mailbox."""
+        self.calls["labels.list"] += 1
+        return {"labels": self.labels}
+
+    def modify_message(self, message_id: str, body: dict) -> dict:
+        """Record the label changes of a message."""
+        self.calls["messages.modify"] += 1
+        self.modified.append(("message", message_id, body))
+        return {"id": message_id}
+
+    def modify_thread(self, thread_id: str, body: dict) -> dict:
+        """Record the label changes of a thread."""
+        self.calls["threads.modify"] += 1
+        self.modified.append(("thread", thread_id, body))
+        return {"id": thread_id}
+
+
+@pytest.fixture
+def gmail(monkeypatch: pytest.MonkeyPatch) -> FakeGMail:
+    """Replace GMail with a fake."""
+    fake = FakeGMail()
+    monkeypatch.setattr("mail_processor.services.GMailServices", lambda: fake)
+    monkeypatch.setattr(
+        "mail_processor.rule_engine.GMailServices",
+        lambda: fake,
+    )
+    return fake
+
+
+@pytest.fixture
+def database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """Point the connections at an empty database file."""
+    path = tmp_path / "db.sqlite"
+    monkeypatch.setattr(app_config, "SQLITE_DB", path)
+    yield path
+    sqlite_connection.close_all()
+
+
+@pytest.fixture
+def migrated(database: Path) -> Path:
+    """A database migrated to the latest schema."""
+    initialize_models()
+    return database
+
+
+@pytest.fixture
+def insert_messages(
+    migrated: Path,  # noqa: ARG001
+) -> Callable[..., list[Message]]:
+    """Store messages along with their message info."""
+
+    def insert(
+        messages: list[Message],
+        seen_at: int | None = None,
+    ) -> list[Message]:
+        Message.bulk_insert(messages)
+        MessageInfo.bulk_insert(
+            [
+                MessageInfo(
+                    message_id=message.message_id,
+                    thread_id=message.thread_id,
+                    seen_at=seen_at,
+                )
+                for message in messages
+            ],
+        )
+        return messages
+
+    return insert
+
+
+def make_message(  # noqa: PLR0913
+    index: int,
+    *,
+    days_old: int = 0,
+    body: str | None = "body",
+    from_: str = "sender@example.com",
+    thread_id: str | None = None,
+    label_ids: list[str] | None = None,
+) -> Message:
+    """A message, older ones have higher indexes like the list API."""
+    date = NOW - timedelta(days=days_old, minutes=index)
+    return Message(
+        message_id=f"{index:016x}",
+        thread_id=thread_id or f"t{index:015x}",
+        from_=from_,
+        to="me@example.com",
+        subject=f"Subject {index}",
+        date=date.isoformat(),
+        body=body,
+        label_ids=label_ids if label_ids is not None else ["INBOX"],
+        internal_date=int(date.timestamp() * 1000),
+        size_estimate=len(body or ""),
+    )
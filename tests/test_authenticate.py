@@ -0,0 +1,85 @@
+"""Token refresh shared between processes."""
+
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from mail_processor.authenticate import (
+    needs_refresh,
+    refresh_credentials,
+    write_token,
+)
+from mail_processor.config import app_config
+from mail_processor.constants import TOKEN_REFRESH_MARGIN
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def make_credentials(token: str, expires_in: timedelta) -> Credentials:
+    """Credentials with an access token expiring ``expires_in`` from now."""
+    return Credentials(
+        token=token,
+        refresh_token="refresh-token",
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id="client-id",
+        client_secret="client-secret",
+        expiry=datetime.now(UTC).replace(tzinfo=None) + expires_in,
+    )
+
+
+@pytest.fixture
+def token_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point the token at a temporary file."""
+    path = tmp_path / "token.json"
+    monkeypatch.setattr(app_config, "TOKEN_JSON_PATH", path)
+    return path
+
+
+def test_needs_refresh_within_margin() -> None:
+    soon = TOKEN_REFRESH_MARGIN - timedelta(seconds=30)
+    later = TOKEN_REFRESH_MARGIN + timedelta(minutes=1)
+    assert needs_refresh(make_credentials("token", soon))
+    assert not needs_refresh(make_credentials("token", later))
+    assert not needs_refresh(Credentials(token="token"))
+
+
+def test_refresh_adopts_token_of_another_process(
+    token_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    write_token(make_credentials("fresh", timedelta(hours=1)))
+
+    def refresh(self: Credentials, request: object) -> None:  # noqa: ARG001
+        pytest.fail("The token refreshed by another process was refreshed.")
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    credentials = make_credentials("expired", -timedelta(minutes=1))
+    assert refresh_credentials(credentials) is credentials
+    assert credentials.token == "fresh"
+    assert not needs_refresh(credentials)
+
+
+def test_refresh_persists_the_new_token(
+    token_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    credentials = make_credentials("expired", -timedelta(minutes=1))
+    write_token(credentials)
+
+    def refresh(self: Credentials, request: object) -> None:  # noqa: ARG001
+        self.token = "refreshed"
+        self.expiry = datetime.now(UTC).replace(tzinfo=None) + timedelta(
+            hours=1,
+        )
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    refresh_credentials(credentials)
+    assert credentials.token == "refreshed"
+    assert json.loads(token_path.read_text())["token"] == "refreshed"
+    assert not list(token_path.parent.glob(f".{token_path.name}.*"))
@@ -0,0 +1,67 @@
+"""Local label cache and label resolution."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from mail_processor.config import app_config
+from mail_processor.errors import UnknownLabelError
+from mail_processor.label_cache import LabelResolver, get_labels
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeGMail
+
+pytestmark = pytest.mark.usefixtures("migrated")
+
+RECEIPTS = {"id": "Label_1", "name": "Receipts", "type": "user"}
+TRAVEL = {"id": "Label_2", "name": "Travel", "type": "user"}
+
+
+def test_labels_are_cached_until_stale(
+    gmail: FakeGMail,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    gmail.labels = [RECEIPTS]
+    assert [label.name for label in get_labels()] == ["Receipts"]
+    assert [label.name for label in get_labels()] == ["Receipts"]
+    assert gmail.calls["labels.list"] == 1
+
+    monkeypatch.setattr(app_config, "LABEL_CACHE_TTL", 0)
+    gmail.labels = [RECEIPTS, TRAVEL]
+    assert [label.name for label in get_labels()] == ["Receipts", "Travel"]
+    assert gmail.calls["labels.list"] == 2  # noqa: PLR2004
+
+
+def test_resolver_refreshes_once_on_a_miss(gmail: FakeGMail) -> None:
+    gmail.labels = [RECEIPTS]
+    get_labels()
+    gmail.labels = [RECEIPTS, TRAVEL]
+
+    resolver = LabelResolver()
+    assert resolver.resolve("Label_1") == "Label_1"
+    assert resolver.resolve("receipts") == "Label_1"
+    assert gmail.calls["labels.list"] == 1
+
+    assert resolver.resolve("Travel") == "Label_2"
+    with pytest.raises(UnknownLabelError):
+        resolver.resolve("Unknown")
+    assert gmail.calls["labels.list"] == 2  # noqa: PLR2004
+
+
+def test_offline_resolver_never_calls_gmail(
+    gmail: FakeGMail,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    gmail.labels = [RECEIPTS]
+    get_labels()
+    gmail.labels = [RECEIPTS, TRAVEL]
+    # NOTE: Stale, an online resolver would refresh it.
+    monkeypatch.setattr(app_config, "LABEL_CACHE_TTL", 0)
+
+    resolver = LabelResolver(offline=True)
+    assert resolver.resolve("Receipts") == "Label_1"
+    with pytest.raises(UnknownLabelError):
+        resolver.resolve("Travel")
+    assert gmail.calls["labels.list"] == 1
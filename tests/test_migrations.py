@@ -0,0 +1,232 @@
+"""Schema migrations, their triggers and backfills."""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import TYPE_CHECKING
+
+import pytest
+
+from mail_processor.database import migrations
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.database.migrations import (
+    MIGRATIONS,
+    apply_migrations,
+    backfill_message_metadata,
+    run_backfills,
+)
+from mail_processor.errors import RateLimitedError
+from mail_processor.models import Message
+from tests.conftest import make_message
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def query(sql: str, params: tuple = ()) -> list[tuple]:
+    """Rows of a query on the writer, which sees uncommitted changes."""
+    with sqlite_connection.writer() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def test_migrates_new_database_to_latest(database: Path) -> None:
+    assert apply_migrations() == MIGRATIONS[-1].version
+    assert query("PRAGMA user_version") == [(MIGRATIONS[-1].version,)]
+
+
+def test_migrations_are_idempotent(migrated: Path) -> None:
+    assert apply_migrations() == MIGRATIONS[-1].version
+
+
+def test_failed_migration_rolls_back(
+    database: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    broken = migrations.Migration(
+        version=MIGRATIONS[-1].version + 1,
+        description="Broken",
+        statements=["CREATE TABLE broken (id INTEGER)", "NOT SQL"],
+    )
+    monkeypatch.setattr(migrations, "MIGRATIONS", [*MIGRATIONS, broken])
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations()
+    assert query("PRAGMA user_version") == [(MIGRATIONS[-1].version,)]
+    assert not query("SELECT name FROM sqlite_master WHERE name = 'broken'")
+
+
+def test_migrates_existing_database_to_incremental_vacuum(
+    database: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # NOTE: New databases are created in incremental mode, the ones
+    # created before it had a table by then.
+    with sqlite3.connect(database) as conn:
+        conn.execute("CREATE TABLE legacy (id INTEGER)")
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:6])
+        apply_migrations()
+    Message.bulk_insert([make_message(i) for i in range(3)])
+    assert query("PRAGMA auto_vacuum") == [(0,)]
+
+    apply_migrations()
+    assert query("PRAGMA auto_vacuum") == [(migrations.INCREMENTAL,)]
+    columns = {row[1] for row in query("PRAGMA table_info(message_info)")}
+    assert {"seen_at", "evicted_at"} <= columns
+    assert query("SELECT COUNT(*) FROM message") == [(3,)]
+
+
+class MetadataService:
+    """Answers metadata requests, rate limiting the ``throttled`` ids."""
+
+    def __init__(self, existing: set[str], throttled: set[str]) -> None:
+        """Initialize with the ids GMail has."""
+        self.existing = existing
+        self.throttled = throttled
+
+    def get_messages_metadata(
+        self,
+        message_ids: list[str],
+    ) -> tuple[dict[str, dict], list[str]]:
+        """Resources of the existing ids, and the ids not found."""
+        resources = {
+            message_id: {
+                "id": message_id,
+                "labelIds": ["INBOX"],
+                "internalDate": "1000",
+                "sizeEstimate": 10,
+            }
+            for message_id in message_ids
+            if message_id in self.existing
+            and message_id not in self.throttled
+        }
+        not_found = [
+            message_id
+            for message_id in message_ids
+            if message_id not in self.existing
+        ]
+        return resources, not_found
+
+
+def insert_without_metadata(count: int) -> list[str]:
+    """Insert messages synced before the metadata columns existed."""
+    messages = [make_message(i) for i in range(count)]
+    for message in messages:
+        message.internal_date = None
+    Message.bulk_insert(messages)
+    return [message.message_id for message in messages]
+
+
+def test_backfill_marks_only_missing_messages_unavailable(
+    migrated: Path,
+) -> None:
+    ids = insert_without_metadata(6)
+    service = MetadataService(existing=set(ids[:4]), throttled={ids[0]})
+
+    with pytest.raises(RateLimitedError):
+        backfill_message_metadata(service)
+    assert dict(query("SELECT message_id, internal_date FROM message")) == {
+        ids[0]: None,
+        ids[1]: 1000,
+        ids[2]: 1000,
+        ids[3]: 1000,
+        ids[4]: -1,
+        ids[5]: -1,
+    }
+
+    service.throttled = set()
+    assert backfill_message_metadata(service) == 1
+    assert query(
+        "SELECT internal_date FROM message WHERE message_id = ?",
+        (ids[0],),
+    ) == [(1000,)]
+
+
+def test_backfill_is_recorded_once_complete(migrated: Path) -> None:
+    ids = insert_without_metadata(3)
+    service = MetadataService(existing=set(ids), throttled={ids[0]})
+    with pytest.raises(RateLimitedError):
+        run_backfills(service)
+    assert not query("SELECT version FROM schema_backfill")
+
+    service.throttled = set()
+    run_backfills(service)
+    assert query("SELECT version FROM schema_backfill") == [(2,)]
+
+
+def test_backfill_searches_an_index(migrated: Path) -> None:
+    plan = query(
+        "EXPLAIN QUERY PLAN SELECT message_id FROM message "
+        "WHERE internal_date IS NULL LIMIT 500",
+    )
+    assert plan[0][3].startswith("SEARCH message USING INDEX")
+
+
+def test_thread_aggregate_follows_messages(migrated: Path) -> None:
+    Message.bulk_insert(
+        [
+            make_message(0, thread_id="t", from_="a@example.com"),
+            make_message(1, thread_id="t", from_="b@example.com"),
+            make_message(2, thread_id="t", from_="a@example.com"),
+        ],
+    )
+    assert query(
+        "SELECT message_count, latest_date, participants FROM thread",
+    ) == [
+        (
+            3,
+            make_message(0).internal_date,
+            '["a@example.com","b@example.com"]',
+        ),
+    ]
+
+    Message.delete(make_message(0).message_id)
+    assert query("SELECT message_count, latest_date FROM thread") == [
+        (2, make_message(1).internal_date),
+    ]
+    Message.delete_many([make_message(1).message_id, make_message(2).message_id])
+    assert not query("SELECT * FROM thread")
+
+
+def test_from_domain_is_generated(migrated: Path) -> None:
+    Message.bulk_insert(
+        [
+            make_message(0, from_="A@Mail.Example.com"),
+            make_message(1, from_="undisclosed-recipients"),
+        ],
+    )
+    assert query("SELECT from_domain FROM message ORDER BY message_id") == [
+        ("mail.example.com",),
+        (None,),
+    ]
+
+
+def test_sender_aggregate_follows_messages(migrated: Path) -> None:
+    Message.bulk_insert(
+        [
+            make_message(0, label_ids=["INBOX", "UNREAD"]),
+            make_message(1, label_ids=["INBOX"]),
+            make_message(2, from_="other@example.org"),
+        ],
+    )
+    assert query(
+        "SELECT address, domain, message_count, unread_count FROM sender "
+        "ORDER BY address",
+    ) == [
+        ("other@example.org", "example.org", 1, 0),
+        ("sender@example.com", "example.com", 2, 1),
+    ]
+
+    Message.modify_labels([make_message(1).message_id], ["UNREAD"], [])
+    Message.delete(make_message(2).message_id)
+    assert query(
+        "SELECT address, message_count, unread_count, first_seen, last_seen "
+        "FROM sender",
+    ) == [
+        (
+            "sender@example.com",
+            2,
+            2,
+            make_message(1).internal_date,
+            make_message(0).internal_date,
+        ),
+    ]
@@ -0,0 +1,98 @@
+"""Ordering of the conditions of a rule."""
+
+from __future__ import annotations
+
+import pytest
+
+from mail_processor.models import Message, Statistics
+from mail_processor.rule_engine import get_where_clause
+from mail_processor.rule_engine.optimizer import order_conditions
+from mail_processor.rule_engine.schema import RuleSchema
+from tests.conftest import make_message
+
+BODY_CONTAINS = {"field_name": "Body", "predicate": "contains", "value": "x"}
+SUBJECT_EQUALS = {"field_name": "Subject", "predicate": "equals", "value": "x"}
+RECENT = {
+    "field_name": "Date",
+    "predicate": "less than",
+    "value": 30,
+    "unit": "days",
+}
+
+
+def make_rule(predicate: str, conditions: list[dict]) -> RuleSchema:
+    """Rule of the conditions."""
+    return RuleSchema(
+        name="rule",
+        predicate=predicate,
+        conditions=conditions,
+        actions=[{"type": "Mark as Read"}],
+    )
+
+
+def field_order(rule_obj: RuleSchema, statistics: Statistics | None) -> list:
+    """Fields and values of the conditions, in evaluation order."""
+    return [
+        (condition.field_name, condition.value)
+        for condition, _ in order_conditions(rule_obj, statistics)
+    ]
+
+
+def test_all_evaluates_cheap_selective_conditions_first() -> None:
+    rule_obj = make_rule("all", [BODY_CONTAINS, SUBJECT_EQUALS])
+    assert field_order(rule_obj, None) == [("Subject", "x"), ("Body", "x")]
+
+
+def test_any_evaluates_cheap_likely_matches_first() -> None:
+    rule_obj = make_rule("any", [BODY_CONTAINS, RECENT])
+    assert field_order(rule_obj, None) == [("Date", 30), ("Body", "x")]
+
+
+@pytest.mark.usefixtures("migrated")
+def test_statistics_pick_the_rarest_sender_first() -> None:
+    Message.bulk_insert(
+        [make_message(i, from_="common@example.com") for i in range(9)]
+        + [make_message(9, from_="rare@example.com")],
+    )
+    statistics = Statistics.refresh()
+    common, rare = (
+        {"field_name": "From", "predicate": "equals", "value": address}
+        for address in ("common@example.com", "rare@example.com")
+    )
+
+    assert field_order(make_rule("all", [common, rare]), statistics) == [
+        ("From", "rare@example.com"),
+        ("From", "common@example.com"),
+    ]
+    assert field_order(make_rule("any", [rare, common]), statistics) == [
+        ("From", "common@example.com"),
+        ("From", "rare@example.com"),
+    ]
+
+
+def test_where_clause_follows_the_order() -> None:
+    where_clause, params = get_where_clause(
+        make_rule("all", [BODY_CONTAINS, SUBJECT_EQUALS]),
+    )
+    assert where_clause.index("subject") < where_clause.index("body")
+    assert where_clause.startswith("likelihood(")
+    assert params == ["x", "%x%"]
+
+
+@pytest.mark.usefixtures("migrated")
+def test_order_doesnt_change_the_matches() -> None:
+    messages = [make_message(i) for i in range(4)]
+    messages[0].subject = "x"
+    messages[1].body = "x"
+    messages[2].subject = "x"
+    messages[2].body = "x"
+    Message.bulk_insert(messages)
+    for conditions in (
+        [BODY_CONTAINS, SUBJECT_EQUALS],
+        [SUBJECT_EQUALS, BODY_CONTAINS],
+    ):
+        where_clause, params = get_where_clause(make_rule("all", conditions))
+        assert [
+            message.message_id
+            for message in Message.get_by_filter(where_clause, params)
+        ] == [messages[2].message_id]
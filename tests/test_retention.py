@@ -0,0 +1,244 @@
+"""Retention of the local database."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+
+from mail_processor import retention
+from mail_processor.config import app_config
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.models import Message, MessageInfo
+from mail_processor.retention import (
+    BYTES_PER_MB,
+    RetentionResult,
+    apply_retention,
+    drop_old_bodies,
+    enforce_max_size,
+    evict_deleted,
+    incremental_vacuum,
+    unevictable_bytes,
+    used_bytes,
+)
+from tests.conftest import make_message
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+BODY = "x" * 4000
+
+
+def query(sql: str) -> list[tuple]:
+    """Rows of a query on the writer."""
+    with sqlite_connection.writer() as conn:
+        return conn.execute(sql).fetchall()
+
+
+def bodies() -> dict[str, bool]:
+    """Whether each stored message still has its body."""
+    with sqlite_connection.writer() as conn:
+        return dict(
+            conn.execute("SELECT message_id, body IS NOT NULL FROM message"),
+        )
+
+
+@pytest.fixture
+def no_retention(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Turn every retention setting off."""
+    monkeypatch.setattr(app_config, "RETENTION_BODY_DAYS", None)
+    monkeypatch.setattr(app_config, "RETENTION_MAX_DB_MB", None)
+    monkeypatch.setattr(app_config, "RETENTION_EVICT_DELETED", False)
+
+
+def test_evict_deleted_keeps_listed_messages(
+    insert_messages: Callable,
+) -> None:
+    insert_messages([make_message(i) for i in range(3)], seen_at=1)
+    insert_messages([make_message(i) for i in range(3, 5)], seen_at=2)
+    assert evict_deleted(seen_since=2) == 3
+    assert sorted(bodies()) == [
+        make_message(3).message_id,
+        make_message(4).message_id,
+    ]
+    assert [info.message_id for info in MessageInfo.get_all()] == sorted(
+        bodies(),
+    )
+
+
+def test_drop_old_bodies_keeps_headers(insert_messages: Callable) -> None:
+    old = insert_messages([make_message(i, days_old=40) for i in range(3)])
+    recent = insert_messages([make_message(i, days_old=1) for i in range(3, 5)])
+    assert drop_old_bodies(30) == 3
+    assert bodies() == {
+        **{message.message_id: False for message in old},
+        **{message.message_id: True for message in recent},
+    }
+    stored = Message.get_by_message_id(old[0].message_id)
+    assert stored.subject == old[0].subject
+    assert stored.label_ids == old[0].label_ids
+    assert stored.internal_date == old[0].internal_date
+
+
+def test_oldest_bodies_are_the_first_received(
+    insert_messages: Callable,
+) -> None:
+    messages = [make_message(i) for i in range(3)]
+    # NOTE: Received first, but its Date header compares as later text.
+    messages[0].internal_date = messages[2].internal_date - 1
+    messages[0].date = "2026-01-01T10:00:00+05:00"
+    messages[1].date = None
+    messages[2].date = "2026-01-01T06:00:00+00:00"
+    insert_messages(messages)
+    assert [
+        message_id for message_id, _ in Message.get_oldest_bodies(10)
+    ] == [messages[i].message_id for i in (0, 2, 1)]
+    assert Message.get_oldest_ids(1) == [messages[0].message_id]
+    assert [
+        message_id
+        for message_id, _ in Message.get_oldest_bodies(
+            10,
+            messages[1].internal_date,
+        )
+    ] == [messages[0].message_id, messages[2].message_id]
+
+
+def test_drop_bodies_leaves_the_aggregates_unchanged(
+    insert_messages: Callable,
+) -> None:
+    insert_messages(
+        [
+            make_message(i, thread_id=f"t{i % 3}", label_ids=["UNREAD"])
+            for i in range(9)
+        ],
+    )
+    aggregates = (
+        query("SELECT * FROM thread ORDER BY thread_id"),
+        query("SELECT * FROM sender"),
+    )
+    triggers = query(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+        "ORDER BY name",
+    )
+
+    Message.drop_bodies([make_message(i).message_id for i in range(9)])
+    assert not any(bodies().values())
+    assert (
+        query("SELECT * FROM thread ORDER BY thread_id"),
+        query("SELECT * FROM sender"),
+    ) == aggregates
+    assert (
+        query(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+            "ORDER BY name",
+        )
+        == triggers
+    )
+    insert_messages([make_message(9, thread_id="t0")])
+    assert query("SELECT message_count FROM sender") == [(10,)]
+
+
+def test_enforce_max_size_drops_only_the_bodies_needed(
+    insert_messages: Callable,
+) -> None:
+    insert_messages([make_message(i, body=BODY) for i in range(200)])
+    max_bytes = used_bytes() - 20 * len(BODY)
+
+    dropped, evicted = enforce_max_size(max_bytes / BYTES_PER_MB)
+    assert used_bytes() <= max_bytes
+    assert evicted == 0
+    assert 20 <= dropped < 40
+    # NOTE: The oldest messages have the highest indexes.
+    kept = bodies()
+    assert not any(kept[make_message(i).message_id] for i in range(180, 200))
+    assert all(kept[make_message(i).message_id] for i in range(160))
+
+
+def test_enforce_max_size_evicts_oldest_messages_without_bodies(
+    insert_messages: Callable,
+) -> None:
+    insert_messages([make_message(i, body=None) for i in range(2000)])
+    max_bytes = used_bytes() * 3 // 4
+
+    dropped, evicted = enforce_max_size(max_bytes / BYTES_PER_MB)
+    assert used_bytes() <= max_bytes
+    assert dropped == 0
+    assert 0 < evicted < 1000
+    remaining = sorted(bodies(), reverse=True)
+    assert remaining[0] == make_message(2000 - evicted - 1).message_id
+    evicted_ids = {
+        info.message_id
+        for info in MessageInfo.get_all()
+        if info.message_id not in bodies()
+    }
+    assert len(evicted_ids) == evicted
+    assert not Message.get_missing_ids(sorted(evicted_ids))
+
+
+def test_enforce_max_size_refuses_an_unreachable_cap(
+    insert_messages: Callable,
+) -> None:
+    insert_messages([make_message(i, body=None) for i in range(100)])
+    floor = unevictable_bytes()
+    assert 0 < floor < used_bytes()
+    # NOTE: The savepoint measuring the floor is rolled back.
+    assert Message.count() == 100  # noqa: PLR2004
+    assert query("SELECT COUNT(*) FROM thread") == [(100,)]
+
+    assert enforce_max_size((floor - 1) / BYTES_PER_MB) == (0, 0)
+    assert Message.count() == 100  # noqa: PLR2004
+
+
+def test_incremental_vacuum_shrinks_the_file(
+    insert_messages: Callable,
+    migrated: Path,
+) -> None:
+    messages = insert_messages([make_message(i, body=BODY) for i in range(200)])
+    Message.drop_bodies([message.message_id for message in messages])
+    before = migrated.stat().st_size + _wal_size(migrated)
+    assert incremental_vacuum() > 0
+    sqlite_connection.close_all()
+    assert migrated.stat().st_size < before
+
+
+def _wal_size(path: Path) -> int:
+    wal = path.with_name(path.name + "-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+@pytest.mark.usefixtures("no_retention")
+def test_apply_retention_does_nothing_without_settings(
+    insert_messages: Callable,
+) -> None:
+    insert_messages([make_message(i, days_old=400) for i in range(3)])
+    # NOTE: Pages freed by the migrations are given back first.
+    incremental_vacuum()
+    assert apply_retention(seen_since=10**15) == RetentionResult(0, 0, 0, 0)
+    assert all(bodies().values())
+
+
+@pytest.mark.usefixtures("no_retention")
+def test_apply_retention_applies_settings(
+    insert_messages: Callable,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    insert_messages([make_message(0, days_old=400)], seen_at=1)
+    insert_messages([make_message(1, days_old=400)], seen_at=2)
+    insert_messages([make_message(2)], seen_at=2)
+    monkeypatch.setattr(app_config, "RETENTION_EVICT_DELETED", True)
+    monkeypatch.setattr(app_config, "RETENTION_BODY_DAYS", 30)
+    monkeypatch.setattr(app_config, "RETENTION_MAX_DB_MB", 100)
+    enforced = []
+    monkeypatch.setattr(
+        retention,
+        "enforce_max_size",
+        lambda max_mb: enforced.append(max_mb) or (0, 0),
+    )
+
+    result = apply_retention(seen_since=2)
+    assert (result.evicted_deleted, result.dropped_bodies) == (1, 1)
+    assert enforced == [100]
+    assert bodies() == {
+        make_message(1).message_id: False,
+        make_message(2).message_id: True,
+    }
@@ -0,0 +1,194 @@
+"""Rule evaluation and actions."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from pydantic import ValidationError
+
+from mail_processor.database.functions import compile_pattern
+from mail_processor.models import Message, Sender
+from mail_processor.rule_engine import ActionExecutor, filter_messages
+from mail_processor.rule_engine.schema import RuleSchema
+from tests.conftest import make_message
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeGMail
+
+pytestmark = pytest.mark.usefixtures("migrated")
+
+READ = {"addLabelIds": [], "removeLabelIds": ["UNREAD"]}
+
+
+def make_rule(conditions: list[dict], **kwargs: str) -> RuleSchema:
+    """Rule marking the messages matching all the conditions as read."""
+    return RuleSchema(
+        name="rule",
+        predicate=kwargs.pop("predicate", "all"),
+        conditions=conditions,
+        actions=[{"type": "Mark as Read"}],
+        **kwargs,
+    )
+
+
+def matching_ids(rule_obj: RuleSchema) -> list[int]:
+    """Indexes of the messages a rule matches."""
+    return sorted(
+        int(message.message_id, 16) for message in filter_messages(rule_obj)
+    )
+
+
+def test_regex_conditions() -> None:
+    messages = [make_message(i) for i in range(3)]
+    messages[0].subject = "Invoice #1234 for October"
+    messages[1].subject = "INVOICE #99"
+    messages[2].subject = "Your invoice is ready"
+    Message.bulk_insert(messages)
+    matches = {"field_name": "Subject", "value": r"invoice #\d+"}
+    assert matching_ids(
+        make_rule([{**matches, "predicate": "matches regex"}]),
+    ) == [0, 1]
+    assert matching_ids(
+        make_rule([{**matches, "predicate": "does not match regex"}]),
+    ) == [2]
+
+
+def test_invalid_regex_is_rejected() -> None:
+    with pytest.raises(ValidationError, match="Invalid regex"):
+        make_rule(
+            [
+                {
+                    "field_name": "Body",
+                    "predicate": "matches regex",
+                    "value": "(unclosed",
+                },
+            ],
+        )
+
+
+def test_patterns_are_compiled_once() -> None:
+    compile_pattern.cache_clear()
+    assert compile_pattern("abc") is compile_pattern("abc")
+    assert compile_pattern.cache_info().misses == 1
+
+
+def test_domain_conditions() -> None:
+    Message.bulk_insert(
+        [
+            make_message(0, from_="a@example.com"),
+            make_message(1, from_="b@Mail.Example.org"),
+            make_message(2, from_="c@other.net"),
+            make_message(3, from_="undisclosed-recipients"),
+        ],
+    )
+    domains = {
+        "field_name": "From Domain",
+        "value": ["@Example.com", "mail.example.org"],
+    }
+    assert matching_ids(make_rule([{**domains, "predicate": "in"}])) == [
+        0,
+        1,
+    ]
+    assert matching_ids(make_rule([{**domains, "predicate": "not in"}])) == [
+        2,
+        3,
+    ]
+
+
+def test_thread_conditions() -> None:
+    Message.bulk_insert(
+        [
+            make_message(0, thread_id="a", from_="a@example.com"),
+            make_message(1, thread_id="a", from_="b@example.com"),
+            make_message(2, thread_id="a", from_="a@example.com"),
+            make_message(3, thread_id="b"),
+        ],
+    )
+    assert matching_ids(
+        make_rule(
+            [
+                {
+                    "field_name": "Thread Messages",
+                    "predicate": "greater than",
+                    "value": 1,
+                },
+            ],
+        ),
+    ) == [0, 1, 2]
+    assert matching_ids(
+        make_rule(
+            [
+                {
+                    "field_name": "Thread Participants",
+                    "predicate": "equals",
+                    "value": 1,
+                },
+            ],
+        ),
+    ) == [3]
+
+
+def test_thread_scope_modifies_each_thread_once(gmail: FakeGMail) -> None:
+    messages = [
+        make_message(0, thread_id="a"),
+        make_message(1, thread_id="a"),
+        make_message(2, thread_id="b"),
+    ]
+    Message.bulk_insert(messages)
+    rule_obj = make_rule([], scope="thread")
+
+    ActionExecutor(rule_obj=rule_obj, filtered_messages=messages).execute()
+    assert gmail.modified == [("thread", "a", READ), ("thread", "b", READ)]
+    assert not gmail.calls["messages.modify"]
+
+
+def stored_labels() -> dict[str, list[str]]:
+    """Labels of the stored messages by id."""
+    return {
+        message.message_id: message.label_ids for message in Message.get_all()
+    }
+
+
+def test_actions_update_the_stored_labels(gmail: FakeGMail) -> None:
+    messages = [
+        make_message(i, label_ids=["INBOX", "UNREAD"]) for i in range(3)
+    ]
+    Message.bulk_insert(messages)
+
+    ActionExecutor(rule_obj=make_rule([]), filtered_messages=messages).execute()
+    assert gmail.modified == [
+        ("message", message.message_id, READ) for message in messages
+    ]
+    assert set(map(tuple, stored_labels().values())) == {("INBOX",)}
+    [sender] = Sender.get_top(10)
+    assert (sender.message_count, sender.unread_count) == (3, 0)
+
+
+def test_actions_interrupted_update_the_messages_modified(
+    gmail: FakeGMail,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    messages = [
+        make_message(i, label_ids=["INBOX", "UNREAD"]) for i in range(3)
+    ]
+    Message.bulk_insert(messages)
+    modify_message = gmail.modify_message
+
+    def fail_second(message_id: str, body: dict) -> dict:
+        if gmail.calls["messages.modify"] == 1:
+            msg = "Service unavailable"
+            raise RuntimeError(msg)
+        return modify_message(message_id, body)
+
+    monkeypatch.setattr(gmail, "modify_message", fail_second)
+    with pytest.raises(RuntimeError):
+        ActionExecutor(
+            rule_obj=make_rule([]),
+            filtered_messages=messages,
+        ).execute()
+    assert stored_labels() == {
+        messages[0].message_id: ["INBOX"],
+        messages[1].message_id: ["INBOX", "UNREAD"],
+        messages[2].message_id: ["INBOX", "UNREAD"],
+    }
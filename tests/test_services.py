@@ -0,0 +1,73 @@
+"""GMail API calls, their retries and quota."""
+
+from __future__ import annotations
+
+import json
+from typing import Callable
+
+import pytest
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+from mail_processor import services
+from mail_processor.services import GMailServices
+
+RATE_LIMITED = (
+    {"status": "429"},
+    json.dumps({"error": {"code": 429, "message": "Too many requests"}}),
+)
+NOT_FOUND = (
+    {"status": "404"},
+    json.dumps({"error": {"code": 404, "message": "Not found"}}),
+)
+LABELS = ({"status": "200"}, json.dumps({"labels": []}))
+
+
+@pytest.fixture
+def acquired(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Quota units taken from the rate limiter, without waiting."""
+    units: list[float] = []
+    monkeypatch.setattr(services.ratelimit, "acquire", units.append)
+    monkeypatch.setattr(services, "backoff", lambda attempt: 0)  # noqa: ARG005
+    return units
+
+
+@pytest.fixture
+def gmail_http(monkeypatch: pytest.MonkeyPatch) -> Callable:
+    """Build the service on a sequence of canned responses."""
+
+    def build(*responses: tuple[dict, str]) -> GMailServices:
+        monkeypatch.setattr(GMailServices, "_instance", None)
+        return GMailServices(http=HttpMockSequence(list(responses)))
+
+    return build
+
+
+def test_every_retry_takes_quota(
+    acquired: list[float],
+    gmail_http: Callable,
+) -> None:
+    service = gmail_http(RATE_LIMITED, RATE_LIMITED, LABELS)
+    assert service.get_labels() == {"labels": []}
+    assert acquired == [1, 1, 1]
+
+
+def test_gives_up_after_the_last_retry(
+    acquired: list[float],
+    gmail_http: Callable,
+) -> None:
+    service = gmail_http(*[RATE_LIMITED] * (services.API_NUM_RETRIES + 1))
+    with pytest.raises(HttpError) as info:
+        service.get_labels()
+    assert info.value.status_code == 429  # noqa: PLR2004
+    assert len(acquired) == services.API_NUM_RETRIES + 1
+
+
+def test_client_errors_are_not_retried(
+    acquired: list[float],
+    gmail_http: Callable,
+) -> None:
+    service = gmail_http(NOT_FOUND, LABELS)
+    with pytest.raises(HttpError):
+        service.get_labels()
+    assert acquired == [1]
@@ -0,0 +1,134 @@
+"""Streaming sync pipeline."""
+
+from __future__ import annotations
+
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import pytest
+
+from mail_processor import synchronizer
+from mail_processor.database.connection import sqlite_connection
+from mail_processor.models import Message
+from mail_processor.synchronizer import SyncPipeline, sync_emails
+
+pytestmark = pytest.mark.usefixtures("migrated")
+
+# Seconds a pipeline run may take before it's considered hung.
+TIMEOUT = 10
+
+
+class MailboxService:
+    """Serves a mailbox of ``count`` messages, failing to fetch some."""
+
+    def __init__(self, count: int, failing: set[str] | None = None) -> None:
+        """Initialize the mailbox."""
+        self.ids = [f"{index:016x}" for index in range(count)]
+        self.failing = failing or set()
+
+    def get_message_infos(self) -> Iterator[list[dict]]:
+        """Pages of message ids."""
+        for start in range(0, len(self.ids), 10):
+            yield [
+                {"id": message_id, "threadId": message_id}
+                for message_id in self.ids[start : start + 10]
+            ]
+
+    def fetch_message(self, message_id: str) -> dict:
+        """Full message resource."""
+        if message_id in self.failing:
+            msg = f"Failed to fetch {message_id}"
+            raise RuntimeError(msg)
+        body = base64.urlsafe_b64encode(b"body").decode()
+        return {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": ["INBOX"],
+            "internalDate": "1000",
+            "sizeEstimate": 4,
+            "payload": {
+                "headers": [
+                    {"name": "From", "value": "Sender <sender@example.com>"},
+                    {"name": "Subject", "value": f"Subject {message_id}"},
+                ],
+                "parts": [{"mimeType": "text/plain", "body": {"data": body}}],
+            },
+        }
+
+
+class ThrottledService(MailboxService):
+    """Rate limits every metadata request."""
+
+    def get_messages_metadata(
+        self,
+        message_ids: list[str],  # noqa: ARG002
+    ) -> tuple[dict[str, dict], list[str]]:
+        """Nothing fetched and nothing missing, all were rate limited."""
+        return {}, []
+
+
+def run(pipeline: SyncPipeline) -> int:
+    """Run the pipeline, failing the test instead of hanging."""
+    executor = ThreadPoolExecutor(1)
+    try:
+        return executor.submit(pipeline.run).result(timeout=TIMEOUT)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def sync_threads() -> list[str]:
+    """Names of the pipeline's threads still running."""
+    return [
+        thread.name
+        for thread in threading.enumerate()
+        if thread.name.startswith("sync-")
+    ]
+
+
+def test_pipeline_writes_every_message() -> None:
+    service = MailboxService(50)
+    pipeline = SyncPipeline(service, workers=3, queue_size=2, batch_size=7)
+    assert run(pipeline) == 50  # noqa: PLR2004
+    assert not Message.get_missing_ids(service.ids)
+    assert pipeline.listed == pipeline.discovered == 50  # noqa: PLR2004
+
+
+def test_pipeline_stops_when_a_worker_fails() -> None:
+    service = MailboxService(200, failing={f"{5:016x}"})
+    pipeline = SyncPipeline(service, workers=3, queue_size=2, batch_size=7)
+    with pytest.raises(RuntimeError, match="Failed to fetch"):
+        run(pipeline)
+    assert not sync_threads()
+    # NOTE: The bounded queues stop the listing long before the end.
+    assert pipeline.listed < len(service.ids)
+
+
+def test_sync_goes_on_while_the_backfill_is_rate_limited(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    service = ThrottledService(20)
+    Message.bulk_insert(
+        [
+            Message(
+                message_id=service.ids[0],
+                thread_id=service.ids[0],
+                from_="sender@example.com",
+                to=None,
+                subject=None,
+                date=None,
+                body=None,
+            ),
+        ],
+    )
+    monkeypatch.setattr(synchronizer, "GMailServices", lambda: service)
+
+    sync_emails()
+    assert not Message.get_missing_ids(service.ids)
+    with sqlite_connection.writer() as conn:
+        assert conn.execute(
+            "SELECT internal_date FROM message WHERE message_id = ?",
+            (service.ids[0],),
+        ).fetchall() == [(None,)]
+        assert not conn.execute("SELECT * FROM schema_backfill").fetchall()